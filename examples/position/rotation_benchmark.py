@@ -0,0 +1,46 @@
+"""
+Compares the closed-form rotations of the position estimation module with scipy's Rotation.
+Run from the project root: python examples/position/rotation_benchmark.py
+"""
+from argparse import ArgumentParser
+from timeit import repeat
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from people_guidance.modules.position_estimation_module.rotation import euler_to_matrix, euler_to_matrices, \
+    rotate_block
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--repeat', '-r', type=int, default=20)
+    parser.add_argument('--number', '-n', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    angles = rng.uniform(-np.pi, np.pi, (1000, 3))
+    accelerations = rng.normal(0.0, 9.81, (1000, 3))
+
+    def best_us(fn, number=args.number):
+        return 1e6 * min(repeat(fn, number=number, repeat=args.repeat)) / number
+
+    # One IMU sample, what position_estimation_simple does for every frame
+    x, y, z = angles[0]
+    rotation, accel_w = np.empty((3, 3)), np.empty(3)
+    scipy_us = best_us(lambda: Rotation.from_euler('xyz', [x, y, z]).apply(accelerations[0]))
+    closed_us = best_us(lambda: np.dot(euler_to_matrix(x, y, z, out=rotation), accelerations[0], out=accel_w))
+    deviation = np.abs(Rotation.from_euler('xyz', [x, y, z]).apply(accelerations[0]) - accel_w).max()
+    print(f"single sample: scipy {scipy_us:.2f}us, closed form {closed_us:.2f}us, max deviation {deviation:.1e}")
+
+    # Blocks of samples
+    for n in (10, 100, 1000):
+        block_angles, block_accelerations = angles[:n], accelerations[:n]
+        matrices, rotated = np.empty((n, 3, 3)), np.empty((n, 3))
+        number = max(1, args.number // n)
+
+        scipy_us = best_us(lambda: Rotation.from_euler('xyz', block_angles).apply(block_accelerations), number)
+        block_us = best_us(lambda: rotate_block(euler_to_matrices(block_angles, out=matrices), block_accelerations,
+                                                out=rotated), number)
+        deviation = np.abs(Rotation.from_euler('xyz', block_angles).apply(block_accelerations) - rotated).max()
+        print(f"block of {n}: scipy {scipy_us:.2f}us, einsum {block_us:.2f}us, max deviation {deviation:.1e}")
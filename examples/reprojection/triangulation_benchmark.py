@@ -0,0 +1,58 @@
+"""
+Compares the batched triangulation of the reprojection module with the OpenCV path it replaced.
+Run from the project root: python examples/reprojection/triangulation_benchmark.py
+"""
+from argparse import ArgumentParser
+from timeit import repeat
+
+import cv2
+import numpy as np
+
+from people_guidance.modules.module import INTRINSIC_MATRIX
+from people_guidance.modules.reprojection_module.triangulation import Triangulator
+
+
+def synthetic_pairs(n_points: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    points3d = np.column_stack((rng.uniform(-3, 3, n_points), rng.uniform(-2, 1, n_points),
+                                rng.uniform(1, 15, n_points)))
+
+    rotation = cv2.Rodrigues(np.array([0.01, 0.03, 0.0]))[0]
+    homography = np.hstack((rotation, np.array([[0.05], [0.0], [-0.3]])))
+    P0 = np.dot(INTRINSIC_MATRIX, np.eye(3, 4))
+    P1 = np.dot(INTRINSIC_MATRIX, homography)
+
+    def project(P):
+        projected = np.dot(np.column_stack((points3d, np.ones(n_points))), P.T)
+        return (projected[:, :2] / projected[:, 2:] + rng.normal(0, 0.5, (n_points, 2))).astype(np.float32)
+
+    return P0, P1, project(P0), project(P1)
+
+
+def opencv_triangulation(P0, P1, points0, points1):
+    points_homo = cv2.triangulatePoints(P0, P1, np.transpose(points0), np.transpose(points1))
+    return cv2.convertPointsFromHomogeneous(points_homo.T).reshape(-1, 3)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--repeat', '-r', type=int, default=50)
+    args = parser.parse_args()
+
+    triangulators = {method: Triangulator(INTRINSIC_MATRIX, method=method) for method in ('MIDPOINT', 'DLT')}
+    for n_points in (100, 1000, 5000):
+        P0, P1, points0, points1 = synthetic_pairs(n_points)
+        reference = opencv_triangulation(P0, P1, points0, points1)
+
+        opencv_ms = 1000 * min(repeat(lambda: opencv_triangulation(P0, P1, points0, points1), number=1,
+                                      repeat=args.repeat))
+        print(f"{n_points} points, opencv: {opencv_ms:.3f}ms")
+
+        for method, triangulator in triangulators.items():
+            points3d, valid = triangulator(P1, points0, points1)
+            # points with almost parallel rays are ill conditioned for every method, only compare the valid ones
+            deviation = np.median(np.linalg.norm(points3d[valid] - reference[valid], axis=1))
+
+            batched_ms = 1000 * min(repeat(lambda: triangulator(P1, points0, points1), number=1, repeat=args.repeat))
+            print(f"    {method} (incl. filtering): {batched_ms:.3f}ms, {valid.sum()} valid, "
+                  f"median deviation from opencv {deviation:.2e}")
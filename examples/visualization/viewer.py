@@ -0,0 +1,35 @@
+"""
+Shows the framebuffer of the headless visualization (main.py --visualize --headless) in an OpenCV window.
+Run from the project root while the pipeline is running: python examples/visualization/viewer.py
+"""
+from argparse import ArgumentParser
+
+import cv2
+
+from people_guidance.modules.visualization_module.framebuffer import SharedFramebuffer, framebuffer_path
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--path', '-p',
+                        help='Path of the framebuffer, defaults to the one of the headless visualization module',
+                        type=str,
+                        default=str(framebuffer_path()))
+    parser.add_argument('--scale', '-s', type=float, default=1.0)
+    args = parser.parse_args()
+
+    framebuffer = SharedFramebuffer(args.path)
+    frame = None
+    last_sequence = 0
+
+    while True:
+        result = framebuffer.read(out=frame)
+        if result is not None and result[0] != last_sequence:
+            last_sequence, timestamp, frame = result
+            shown = frame if args.scale == 1.0 else cv2.resize(frame, None, fx=args.scale, fy=args.scale)
+            cv2.imshow("people_guidance", shown)
+
+        if cv2.waitKey(20) & 0xFF == ord('q'):
+            break
+
+    cv2.destroyAllWindows()
@@ -16,9 +16,8 @@ from people_guidance.modules.reprojection_module import ReprojectionModule
 from people_guidance.modules.position_module import PositionModule
 from people_guidance.modules.feature_tracking_module import FeatureTrackingModule
 from people_guidance.modules.position_estimation_module import PositionEstimationModule
-
-if not is_rpi:
-    from people_guidance.modules.visualization_module import VisualizationModule
+from people_guidance.modules.recorder_module import RecorderModule
+from people_guidance.modules.visualization_module import VisualizationModule, HeadlessVisualizationModule
 
 
 
@@ -44,8 +43,29 @@ if __name__ == '__main__':
                         help='Turn on visualisation',
                         action='store_true')
 
+    parser.add_argument('--headless',
+                        help='Compose the visualisation into shared memory instead of a window, default on the pi. '
+                             'Use examples/visualization/viewer.py to show it',
+                        action='store_true')
+
     parser.add_argument('--save_visualization','-s',
-                        help='Save visualization to file',
+                        help='Save visualization to a video file, or to visualization.avi if a folder is given',
+                        type=str,
+                        default='')
+
+    parser.add_argument('--tracking_workers', '-w',
+                        help='Number of worker processes which track frame pairs in parallel',
+                        type=int,
+                        default=1)
+
+    parser.add_argument('--record_outputs', '-o',
+                        help='Path of folder where to record the outputs of the modules to',
+                        type=str,
+                        default='')
+
+    parser.add_argument('--record_channels',
+                        help='Comma separated channels recorded with --record_outputs, '
+                             'e.g. reprojection_module:points3d',
                         type=str,
                         default='')
 
@@ -61,13 +81,19 @@ if __name__ == '__main__':
         pipeline.add_module(PositionModule, log_level=logging.WARNING)
 
         # Handles feature tracking
-        pipeline.add_module(FeatureTrackingModule, log_level=logging.WARNING)
+        pipeline.add_module(FeatureTrackingModule, log_level=logging.WARNING, workers=args.tracking_workers)
 
         # Handles reprojection
         pipeline.add_module(ReprojectionModule, log_level=logging.WARNING)
 
         # If argument is specified we start visualization
-        if args.visualize:
+        if args.visualize and (args.headless or is_rpi):
+            pipeline.add_module(HeadlessVisualizationModule, log_level=logging.WARNING)
+        elif args.visualize:
             pipeline.add_module(VisualizationModule, log_level=logging.WARNING)
 
+        # Records the outputs of the modules for offline analysis
+        if args.record_outputs:
+            pipeline.add_module(RecorderModule, log_level=logging.WARNING)
+
     pipeline.start()
@@ -0,0 +1,146 @@
+import dataclasses
+from typing import Any, ClassVar, Dict, Tuple
+
+import numpy as np
+
+
+class Message:
+    """
+    Base of the typed messages sent between the modules. Every message type is a dataclass whose fields are stored in
+    __slots__. Messages can still be read like the dicts they replace, msg["cloud"] is msg.cloud.
+
+    Messages are pickled as a plain tuple of their field values without the field names. Large arrays of types with
+    arena_bytes > 0 are sent out-of-band through shared memory, see serialization.py.
+    """
+    __slots__ = ()
+
+    # bytes of shared memory per channel for the out-of-band buffers of this type, 0 sends everything through the queue
+    arena_bytes: ClassVar[int] = 0
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def keys(self):
+        return tuple(field.name for field in dataclasses.fields(self))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {field.name: getattr(self, field.name) for field in dataclasses.fields(self)}
+
+    def replace(self, **changes) -> "Message":
+        return dataclasses.replace(self, **changes)
+
+    def __reduce__(self):
+        # positional arguments of __init__, which follow the order of the fields and not the one of __slots__
+        return type(self), tuple(getattr(self, field.name) for field in dataclasses.fields(self))
+
+    @classmethod
+    def schema(cls) -> Dict[str, Any]:
+        return {field.name: field.type for field in dataclasses.fields(cls)}
+
+
+def check_schema(produced: type, expected: type):
+    """
+    Raises a TypeError if a consumer which expects messages of type expected can not read the messages of type
+    produced. Every field of expected must exist in produced with the same type.
+    """
+    produced_fields, expected_fields = produced.schema(), expected.schema()
+    for name, field_type in expected_fields.items():
+        if name not in produced_fields:
+            raise TypeError(f"{produced.__name__} has no field {name} of {expected.__name__}")
+        if produced_fields[name] != field_type:
+            raise TypeError(f"Field {name} is {produced_fields[name]} in {produced.__name__} but {field_type} in "
+                            f"{expected.__name__}")
+
+
+@dataclasses.dataclass
+class Envelope(Message):
+    # What the queues carry. data is a Message, an untyped dict or serialization.Encoded.
+    __slots__ = ("data", "timestamp", "validity")
+    data: Any
+    timestamp: float
+    validity: int
+
+
+@dataclasses.dataclass
+class IMUData(Message):
+    __slots__ = ("accel_x", "accel_y", "accel_z", "gyro_x", "gyro_y", "gyro_z", "timestamp")
+    accel_x: float  # m/s^2
+    accel_y: float
+    accel_z: float
+    gyro_x: float  # deg/s
+    gyro_y: float
+    gyro_z: float
+    timestamp: float
+
+
+@dataclasses.dataclass
+class Image(Message):
+    # data is the decoded BGR image, or the JPEG buffer of the camera in live mode
+    __slots__ = ("data", "timestamp")
+    data: np.ndarray
+    timestamp: float
+
+    arena_bytes: ClassVar[int] = 32 * 2 ** 20
+
+
+@dataclasses.dataclass
+class FeaturePairs(Message):
+    # point_pairs are (N, 4) float32 rows of (x0, y0, x1, y1) in the processing resolution, divide by scale for the
+    # pixels of the image with frame_id in the frame ring of the feature tracking module
+    __slots__ = ("camera_positions", "point_pairs", "frame_id", "scale", "intrinsic_matrix", "timestamp_pair")
+    camera_positions: np.ndarray  # (k, 3, 4) float32 candidate [R|t]
+    point_pairs: np.ndarray
+    frame_id: int
+    scale: float
+    intrinsic_matrix: np.ndarray
+    timestamp_pair: Tuple[float, float]
+
+
+@dataclasses.dataclass
+class HomographyData(Message):
+    __slots__ = ("homography", "point_pairs", "timestamps", "frame_id", "intrinsic_matrix", "confidence")
+    homography: np.ndarray  # (3, 4) [R|t] from the first to the second camera
+    point_pairs: np.ndarray  # see FeaturePairs
+    timestamps: Tuple[float, float]
+    frame_id: int
+    intrinsic_matrix: np.ndarray
+    confidence: float  # in [0, 1], how clearly the pose was chosen among the candidates of the visual odometry
+
+
+@dataclasses.dataclass
+class PositionData(Message):
+    __slots__ = ("x", "y", "z", "roll", "pitch", "yaw")
+    x: float
+    y: float
+    z: float
+    roll: float
+    pitch: float
+    yaw: float
+
+
+@dataclasses.dataclass
+class PointCloud(Message):
+    __slots__ = ("cloud", "crit")
+    cloud: np.ndarray  # (N, 3) float32 in the guidance frame
+    crit: float  # collision likelihood
+
+
+@dataclasses.dataclass
+class Criticality(Message):
+    __slots__ = ("zones", "speed", "timestamp")
+    zones: Dict[str, Dict[str, float]]  # zone -> n_points, distance, time_to_contact
+    speed: float
+    timestamp: float
+
+
+@dataclasses.dataclass
+class OccupancyData(Message):
+    __slots__ = ("occupancy", "height", "cell_size", "extent", "timestamp")
+    occupancy: np.ndarray  # uint8, row 0 is the far end of the grid
+    height: np.ndarray  # uint8 steps of OCCUPANCY_HEIGHT_RESOLUTION above the floor
+    cell_size: float
+    extent: Tuple[float, float]
+    timestamp: float
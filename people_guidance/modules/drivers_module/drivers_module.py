@@ -10,6 +10,7 @@ from pathlib import Path
 
 from .utils import *
 from ..module import Module
+from ...messages import IMUData, Image
 from ...utils import DEFAULT_DATASET
 
 if platform.uname().machine == 'armv7l':
@@ -27,7 +28,9 @@ class DriversModule(Module):
         super(DriversModule, self).__init__(name="drivers_module",
                                             outputs=[("images", 10000),
                                                      ("accelerations", 100), ("accelerations_vis", 100)],
-                                            inputs=[], log_dir=log_dir)
+                                            inputs=[], log_dir=log_dir,
+                                            schemas={"images": Image, "accelerations": IMUData,
+                                                     "accelerations_vis": IMUData})
         self.args = args
 
     def start(self):
@@ -104,8 +107,9 @@ class DriversModule(Module):
                         self.imu_data.flush()
                     else:
                         # In normal mode, we just publish the data
-                        self.publish("accelerations", data_dict, IMU_VALIDITY_MS)
-                        self.publish("accelerations_vis", data_dict, -1)
+                        imu_data = IMUData(**data_dict)
+                        self.publish("accelerations", imu_data, IMU_VALIDITY_MS)
+                        self.publish("accelerations_vis", imu_data, -1)
             else:
 
                 # We are in replay mode
@@ -138,8 +142,9 @@ class DriversModule(Module):
                 # If the relative time is correct, we publish the data
 
                 if self.imu_timestamp and self.get_time_ms() - self.replay_start_timestamp > self.imu_timestamp - self.imu_first_timestamp:
-                    self.publish("accelerations", self.imu_data_dict, IMU_VALIDITY_MS)
-                    self.publish("accelerations_vis", self.imu_data_dict, -1)
+                    imu_data = IMUData(**self.imu_data_dict)
+                    self.publish("accelerations", imu_data, IMU_VALIDITY_MS)
+                    self.publish("accelerations_vis", imu_data, -1)
 
                     # Reset the timestamp so that a new dataset is read
                     self.imu_timestamp = None
@@ -165,7 +170,7 @@ class DriversModule(Module):
                         img_f.close()
                     else:
                         # In normal mode we just publish the image
-                        self.publish("images", data_dict, IMAGES_VALIDITY_MS)
+                        self.publish("images", Image(**data_dict), IMAGES_VALIDITY_MS)
             else:
                 # We are in replay mode
                 if not self.img_timestamp:
@@ -202,7 +207,7 @@ class DriversModule(Module):
                 # If the relative time is correct, we publish the data
 
                 if self.img_timestamp and self.get_time_ms() - self.replay_start_timestamp > self.img_timestamp - self.img_first_timestamp:
-                    self.publish("images", {"data": self.img, "timestamp": self.img_timestamp}, -1)
+                    self.publish("images", Image(data=self.img, timestamp=self.img_timestamp), -1)
 
                     # Reset the timestamp so that a new dataset is read
                     self.img_timestamp = None
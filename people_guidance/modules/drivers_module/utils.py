@@ -5,6 +5,7 @@
 UNDISTORT_IMAGE = False
 RESIZE_IMAGE = True
 
+# Resolution of the published images. The feature tracking module may process them at a lower resolution.
 RESIZED_IMAGE = (820, 616)
 
 # CAMERA PARAMETERS
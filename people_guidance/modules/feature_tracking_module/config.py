@@ -7,6 +7,18 @@ USE_E = True
 USE_CLAHE = True
 USE_GAUSSIAN = False
 
+# Preprocessing (grayscale conversion, resizing, CLAHE and blur) runs on horizontal stripes in a thread pool
+PREPROCESSING_THREADS = 4
+PREPROCESSING_STRIPES = 4 # Must divide the vertical number of CLAHE tiles so that the tiles line up with the stripes
+CLAHE_CLIP_LIMIT = 5.0
+CLAHE_TILE_GRID = (8, 8) # (horizontal, vertical) number of tiles
+GAUSSIAN_KSIZE = (5, 5)
+
+# Preprocessing and feature detection of the next frame run in parallel to the tracking of the current frame
+USE_PIPELINE = True
+PIPELINE_QUEUE_SIZE = 2 # Maximum number of frames waiting in front of each stage
+FRAME_RING_HISTORY = 8 # Published frames which stay readable by frame id for the subscribers, e.g. the previews
+
 # Parameters used for cv2.calcOpticalFlowPyrLK (KLT tracker)
 lk_params = dict(winSize=(21, 21), maxLevel=3, criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01))
 
@@ -23,3 +35,23 @@ FAST_THRESHOLD = 30
 BIN_MAX_NUM_FEATURES = OF_MAX_NUM_FEATURES
 H_BINS = 5
 V_BINS = 6
+
+# Region of interest. Preprocessing and detection only run inside the ROI, which is derived from the camera pitch.
+USE_ROI = True
+ROI_MASKS = ('CORRIDOR', 'ABOVE_WAIST') # Can contain CORRIDOR and ABOVE_WAIST
+ROI_FULL_FRAME_REFRESH = 10 # Every n-th frame is processed on the full frame
+ROI_MIN_DISTANCE = 2.0 # Obstacles closer than this [m] are not guaranteed to be inside the ROI
+ROI_CORRIDOR_HALF_WIDTH = 0.6 # [m]
+ROI_CAMERA_HEIGHT = 1.3 # Height of the chest mounted camera above the ground [m]
+ROI_WAIST_HEIGHT = 1.0 # [m]
+ROI_HEAD_HEIGHT = 1.9 # [m]
+ROI_PITCH_SMOOTHING = 0.1 # Weight of a new pitch measurement in the exponential moving average
+
+# Processing resolution. The preview resolution is set by RESIZED_IMAGE in the drivers module and stays fixed.
+# Processing falls back to the next lower resolution if the latency exceeds the budget and recovers once it is
+# well under budget again.
+PROCESSING_RESOLUTIONS = ((820, 616), (410, 308))
+LATENCY_BUDGET_MS = 150.0 # Budget between the image being published and its feature point pairs being published
+LATENCY_RECOVERY_RATIO = 0.6 # Switch back to the higher resolution below this fraction of the budget
+LATENCY_SMOOTHING = 0.1 # Weight of a new latency measurement in the exponential moving average
+RESOLUTION_MIN_FRAMES = 30 # Minimum number of frames between two resolution switches
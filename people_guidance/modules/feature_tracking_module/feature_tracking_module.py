@@ -1,45 +1,88 @@
 import pathlib
+import queue
 import cv2
 import numpy as np
-import platform
+import multiprocessing as mp
 
+from collections import namedtuple
 from time import sleep
 from scipy.spatial.transform import Rotation
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
 
+from people_guidance.messages import FeaturePairs, IMUData, Image
 from people_guidance.modules.module import Module
-from people_guidance.utils import project_path
+from people_guidance.utils import project_path, scale_intrinsics, SharedFrameRing
 
 from .config import *
 
-from .matcher import bruteForceMatcher, opticalFlowMatcher
+from .matcher import bruteForceMatcher, opticalFlowMatcher, featureDetector
+from .roi import RegionOfInterest
+from .resolution import ResolutionController
+from .preprocessing import StripePreprocessor
+from .pipelining import StagedPipeline
+from ..drivers_module.utils import RESIZED_IMAGE
 
-# Need this to get cv imshow working on Ubuntu 20.04
-if "Linux" in platform.system():
-    import gi
-    gi.require_version('Gtk', '2.0')
-    import matplotlib
-    matplotlib.use('TkAgg')
+Frame = namedtuple("Frame", ["img_rgb", "frame_id", "timestamp", "published_ms", "resolution", "scale",
+                             "intrinsic_matrix", "mask", "rows", "img", "keypoints"])
 
 
 class FeatureTrackingModule(Module):
 
     def __init__(self, log_dir: pathlib.Path, args=None):
         super(FeatureTrackingModule, self).__init__(name="feature_tracking_module", outputs=[("feature_point_pairs", 1000), ("feature_point_pairs_vis", 1000)],
-                                                    inputs=["drivers_module:images"],
-                                                    log_dir=log_dir)
+                                                    inputs=["drivers_module:images",
+                                                            "drivers_module:accelerations_vis"],
+                                                    log_dir=log_dir,
+                                                    schemas={"feature_point_pairs": FeaturePairs,
+                                                             "feature_point_pairs_vis": FeaturePairs,
+                                                             "drivers_module:images": Image,
+                                                             "drivers_module:accelerations_vis": IMUData})
 
-    def start(self):
-        self.fm = None
+        # The images are published by frame id, subscribers read them from the frame ring. Besides the frames in
+        # flight in the stages the ring keeps the last FRAME_RING_HISTORY published frames.
+        self.frame_ring = SharedFrameRing(2 * PIPELINE_QUEUE_SIZE + 2 + FRAME_RING_HISTORY,
+                                          (RESIZED_IMAGE[1], RESIZED_IMAGE[0], 3))
+        # Only used if the frame pairs are sharded over several worker processes, see set_workers
+        self.worker_tasks: List[mp.Queue] = []
+        self.worker_results: Optional[mp.Queue] = None
+
+    def set_workers(self, workers: int):
+        super().set_workers(workers)
+        if workers > 1:
+            # Every worker has one frame pair in progress and one waiting, the ring also holds the newest frame
+            self.frame_ring = SharedFrameRing(2 * workers + 2 + FRAME_RING_HISTORY,
+                                              (RESIZED_IMAGE[1], RESIZED_IMAGE[0], 3))
+            self.worker_tasks = [mp.Queue() for _ in range(workers)]
+            self.worker_results = mp.Queue()
+
+    def create_matcher(self):
         if USE_OPTICAL_FLOW:
-            self.fm = opticalFlowMatcher(OF_MAX_NUM_FEATURES, self.logger, self.intrinsic_matrix, self.distortion_coeffs, method=DETECTOR, use_H=USE_H, use_E=USE_E)
+            return opticalFlowMatcher(OF_MAX_NUM_FEATURES, self.logger, self.intrinsic_matrix, self.distortion_coeffs, method=DETECTOR, use_H=USE_H, use_E=USE_E)
         else:
-            self.fm = bruteForceMatcher(OF_MAX_NUM_FEATURES, self.logger, self.intrinsic_matrix, method=DETECTOR, use_H=USE_H, use_E=USE_E)
+            return bruteForceMatcher(OF_MAX_NUM_FEATURES, self.logger, self.intrinsic_matrix, method=DETECTOR, use_H=USE_H, use_E=USE_E)
 
+    def start(self):
         self.old_timestamp = 0
+        self.roi = RegionOfInterest(self.intrinsic_matrix)
+        self.resolution = ResolutionController()
+
+        if self.workers > 1:
+            self.start_coordinator()
+
+        self.fm = self.create_matcher()
+        processing_scale = 1.0
+        processing_intrinsics = self.intrinsic_matrix
+        frame_counter = 0
+        frame_id = -1
 
-        # Create a contrast limited adaptive histogram equalization filter
-        clahe = cv2.createCLAHE(clipLimit=5.0)
+        # Grayscale conversion, resizing, contrast limited adaptive histogram equalization and blur. A buffer must not
+        # be reused while it is held: by the matcher window (up to MAX_FRAME_DELTA images), its previous and current
+        # image, the frames waiting between the stages and the frame being preprocessed.
+        self.preprocess = StripePreprocessor(n_outputs=MAX_FRAME_DELTA + 3 + PIPELINE_QUEUE_SIZE + 1)
+        self.detector = None
+
+        # Frame N+1 is preprocessed while frame N is tracked
+        pipeline = StagedPipeline([self.preprocessing_stage, self.tracking_stage], PIPELINE_QUEUE_SIZE, self.logger)
 
         while True:
             img_dict = self.get("drivers_module:images")
@@ -52,36 +95,193 @@ class FeatureTrackingModule(Module):
                 timestamp = img_dict["data"]["timestamp"]
 
                 self.logger.debug(f"Processing image with timestamp {timestamp} ...")
+                frame_id += 1
+                self.frame_ring.write(frame_id, img_rgb)
 
-                img = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+                # Downscale to the processing resolution, all intrinsics downstream must be scaled accordingly
+                resolution = self.resolution.resolution
+                scale = self.resolution.scale(img_rgb.shape[1])
+                if scale != processing_scale:
+                    processing_scale = scale
+                    processing_intrinsics = scale_intrinsics(self.intrinsic_matrix, scale)
+                    self.roi.intrinsic_matrix = processing_intrinsics
 
-                # Apply clahe
-                if USE_CLAHE:
-                    img = clahe.apply(img)
+                # Restrict the processing to the region of interest, except for a periodic full frame refresh
+                frame_counter += 1
+                if USE_ROI and frame_counter % ROI_FULL_FRAME_REFRESH != 0:
+                    self.update_roi_pitch()
+                    mask = self.roi.update((resolution[1], resolution[0]))
+                    rows = self.roi.rows
+                else:
+                    mask, rows = None, None
 
-                # Gaussian filter
-                if USE_GAUSSIAN:
-                    img = cv2.blur(img,(5,5))
+                frame = Frame(img_rgb=img_rgb, frame_id=frame_id, timestamp=timestamp,
+                              published_ms=img_dict["timestamp"], resolution=resolution, scale=scale,
+                              intrinsic_matrix=processing_intrinsics, mask=mask, rows=rows, img=None, keypoints=None)
 
-                if self.fm.should_initialize:
-                    self.fm.initialize(img)
+                if USE_PIPELINE:
+                    pipeline.put(frame)
                 else:
-                    mp1, mp2 = self.fm.match(img)
-                    if mp1.shape[0] > 0:
-                        inliers = (mp1, mp2)
-
-                        transformations = self.fm.getTransformations()
-
-                        if mp1.shape[0] > 0:
-                            self.publish("feature_point_pairs",
-                                        {"camera_positions" : transformations,
-                                        "image": img_rgb,
-                                        "point_pairs": inliers,
-                                        "timestamp_pair": (self.old_timestamp, timestamp)},
-                                        -1)
-                            self.publish("feature_point_pairs_vis",
-                                            {"point_pairs": inliers,
-                                            "img": img_rgb,
-                                            "timestamp": timestamp},
-                                            -1)
-                        self.old_timestamp = timestamp
+                    self.tracking_stage(self.preprocessing_stage(frame))
+
+    def preprocessing_stage(self, frame: Frame) -> Frame:
+        img = self.preprocess(frame.img_rgb, frame.resolution, frame.rows)
+        self.logger.debug(f"Preprocessing timings [ms]: {self.preprocess.timings()}")
+
+        # Features are detected ahead of time, the images usually become the previous image of the next match
+        if self.detector is None or self.detector.intrinsic_matrix is not frame.intrinsic_matrix:
+            self.detector = featureDetector(OF_MAX_NUM_FEATURES, self.logger, frame.intrinsic_matrix,
+                                            self.distortion_coeffs, method=DETECTOR)
+        keypoints = self.detector.detect(img, frame.mask)
+
+        return frame._replace(img=img, keypoints=keypoints)
+
+    def tracking_stage(self, frame: Frame):
+        if frame.intrinsic_matrix is not self.fm.intrinsic_matrix:
+            self.fm.set_intrinsics(frame.intrinsic_matrix)
+        self.fm.mask = frame.mask
+
+        if self.fm.should_initialize:
+            self.fm.initialize(frame.img, frame.keypoints)
+        else:
+            mp1, mp2 = self.fm.match(frame.img, frame.keypoints)
+            if mp1.shape[0] > 0:
+                self.publish_point_pairs(mp1, mp2, self.fm.getTransformations(), frame.frame_id,
+                                         frame.intrinsic_matrix, frame.scale, (self.old_timestamp, frame.timestamp))
+                self.old_timestamp = frame.timestamp
+
+        if self.resolution.update(self.get_time_ms() - frame.published_ms):
+            self.logger.info(f"Latency {self.resolution.latency_ms:.1f}ms, switching processing resolution "
+                             f"to {self.resolution.resolution}")
+
+    def publish_point_pairs(self, mp1, mp2, transformations, frame_id, intrinsic_matrix, scale, timestamp_pair):
+        # Both channels share the payload. The inliers are packed into one (N, 4) float32 array of
+        # (x0, y0, x1, y1) in the processing resolution, the image of the second frame is referenced by its id in the
+        # frame ring. Previews divide the pairs by scale to draw them on the full image.
+        point_pairs = np.hstack((mp1.reshape(-1, 2), mp2.reshape(-1, 2))).astype(np.float32, copy=False)
+        payload = FeaturePairs(camera_positions=transformations.astype(np.float32),
+                               point_pairs=point_pairs,
+                               frame_id=frame_id,
+                               scale=scale,
+                               intrinsic_matrix=intrinsic_matrix,
+                               timestamp_pair=timestamp_pair)
+        self.publish("feature_point_pairs", payload, -1)
+        self.publish("feature_point_pairs_vis", payload, -1)
+
+    def start_coordinator(self):
+        """
+        Distributes consecutive frame pairs round robin over the worker processes and publishes their results in
+        timestamp order. The frames are passed to the workers through the shared frame ring.
+        """
+        # the remaining slots keep the published frames readable for the subscribers
+        max_pairs_in_flight = self.frame_ring.n_slots - 2 - FRAME_RING_HISTORY
+        frame_id = -1
+        next_seq = 0  # sequence number of the next frame pair
+        emit_seq = 0  # sequence number of the next frame pair to publish
+        pairs: Dict[int, Dict] = {}
+        results: Dict[int, Dict] = {}
+        frame_counter = 0
+
+        while True:
+            # Reorder stage: publish finished pairs in order, wait for results while the frame ring is full
+            while True:
+                block = next_seq - emit_seq >= max_pairs_in_flight
+                try:
+                    result = self.worker_results.get(block=block, timeout=1.0 if block else None)
+                    results[result["seq"]] = result
+                except queue.Empty:
+                    break
+
+                while emit_seq in results:
+                    result, pair = results.pop(emit_seq), pairs.pop(emit_seq)
+                    if result["point_pairs"] is not None:
+                        mp1, mp2 = result["point_pairs"]
+                        self.publish_point_pairs(mp1, mp2, result["camera_positions"], pair["frame_id"],
+                                                 pair["intrinsic_matrix"], pair["scale"], pair["timestamp_pair"])
+                    emit_seq += 1
+
+                    if self.resolution.update(self.get_time_ms() - pair["published_ms"]):
+                        self.logger.info(f"Latency {self.resolution.latency_ms:.1f}ms, switching processing "
+                                         f"resolution to {self.resolution.resolution}")
+
+            if next_seq - emit_seq >= max_pairs_in_flight:
+                # the oldest frame in the ring is still needed
+                continue
+
+            img_dict = self.get("drivers_module:images")
+            if not img_dict:
+                sleep(0.001)
+                continue
+
+            img_rgb = img_dict["data"]["data"]
+            timestamp = img_dict["data"]["timestamp"]
+
+            frame_id += 1
+            self.frame_ring.write(frame_id, img_rgb)
+            if frame_id == 0:
+                prev_timestamp = timestamp
+                continue
+
+            frame_counter += 1
+            use_roi = USE_ROI and frame_counter % ROI_FULL_FRAME_REFRESH != 0
+            if use_roi:
+                self.update_roi_pitch()
+
+            scale = self.resolution.scale(img_rgb.shape[1])
+            pairs[next_seq] = {"frame_id": frame_id, "timestamp_pair": (prev_timestamp, timestamp),
+                               "published_ms": img_dict["timestamp"], "scale": scale,
+                               "intrinsic_matrix": scale_intrinsics(self.intrinsic_matrix, scale)}
+            self.worker_tasks[next_seq % self.workers].put({"seq": next_seq, "frame_ids": (frame_id - 1, frame_id),
+                                                            "resolution": self.resolution.resolution, "scale": scale,
+                                                            "pitch": self.roi.pitch, "use_roi": use_roi})
+            next_seq += 1
+            prev_timestamp = timestamp
+
+    def start_worker(self, worker_id: int):
+        fm = self.create_matcher()
+        roi = RegionOfInterest(self.intrinsic_matrix)
+        # Both images of the pair must stay valid, the cores are shared with the other workers
+        preprocess = StripePreprocessor(n_threads=max(PREPROCESSING_THREADS // self.workers, 1), n_outputs=2)
+        scale = 1.0
+
+        while True:
+            task = self.worker_tasks[worker_id].get()
+            result = {"seq": task["seq"], "point_pairs": None, "camera_positions": None}
+
+            if task["scale"] != scale:
+                scale = task["scale"]
+                fm.set_intrinsics(scale_intrinsics(self.intrinsic_matrix, scale))
+                roi.intrinsic_matrix = fm.intrinsic_matrix
+
+            resolution = task["resolution"]
+            if task["use_roi"]:
+                roi.pitch = task["pitch"]
+                fm.mask, rows = roi.update((resolution[1], resolution[0])), roi.rows
+            else:
+                fm.mask, rows = None, None
+
+            frames = [self.frame_ring.read(frame_id, copy=False) for frame_id in task["frame_ids"]]
+            if any(frame is None for frame in frames):
+                self.logger.warning(f"Frames {task['frame_ids']} were overwritten before they were processed.")
+            else:
+                prev_img = preprocess(frames[0], resolution, rows)
+                curr_img = preprocess(frames[1], resolution, rows)
+                mp1, mp2 = fm.match_pair(prev_img, curr_img)
+                if mp1.shape[0] > 0:
+                    result["point_pairs"] = (mp1, mp2)
+                    result["camera_positions"] = fm.getTransformations()
+
+            self.worker_results.put(result)
+
+    def update_roi_pitch(self):
+        # Only the most recent acceleration is relevant for the pitch
+        accelerations = None
+        while True:
+            payload = self.get("drivers_module:accelerations_vis")
+            if not payload:
+                break
+            accelerations = payload
+
+        if accelerations is not None:
+            # In Camera coordinates: Z = X_IMU (forward) and Y = Y_IMU (down)
+            self.roi.update_pitch(accelerations["data"]["accel_x"], accelerations["data"]["accel_y"])
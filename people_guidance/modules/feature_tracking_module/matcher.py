@@ -15,7 +15,7 @@ class Matcher():
         self.prev_kps = None
         self.prev_desc = None
 
-        self.img_window = list() # List of images in the current window
+        self.img_window = list() # List of images in the current window, with their features
         self.len_cheirality = 0
 
         self.logger = logger
@@ -31,19 +31,50 @@ class Matcher():
         self.detector = featureDetector(max_num_features, logger, self.intrinsic_matrix, self.distortion_coeffs, method=self.method)
         self.should_initialize = True
 
-    def initialize(self, img):
-        self.curr_img = img
-        self.prev_img = img
-        self.prev_kps, self.prev_desc = self.detector.detect(img)
+        # Optional uint8 mask, features are only detected where the mask is non zero
+        self.mask = None
+
+        # Features (keypoints, descriptors) which were detected ahead of time for the current and the previous
+        # image, None if they are detected during the match
+        self.curr_features = None
+        self.prev_features = None
+
+    def set_intrinsics(self, K):
+        # The images change size, start over with the next image
+        self.intrinsic_matrix = K
+        self.detector.intrinsic_matrix = K
+        self.img_window = list()
+        self.len_cheirality = 0
+        self.should_initialize = True
+
+    def initialize(self, img, keypoints=None):
+        self.curr_img, self.curr_features = img, keypoints
+        self.prev_img, self.prev_features = img, keypoints
+        self.prev_kps, self.prev_desc = self.detect(img, keypoints)
         self.should_initialize = False
 
+    def detect(self, img, features=None):
+        if features is not None:
+            return features
+        return self.detector.detect(img, self.mask)
+
+    def in_mask(self, keypoints):
+        # The current image is only preprocessed around its mask, features of the previous image which were detected
+        # with another mask can not be tracked outside of it
+        if self.mask is None or keypoints.shape[0] == 0:
+            return keypoints
+        height, width = self.mask.shape[:2]
+        x = np.clip(np.rint(keypoints[:, 0]).astype(np.intp), 0, width - 1)
+        y = np.clip(np.rint(keypoints[:, 1]).astype(np.intp), 0, height - 1)
+        return keypoints[self.mask[y, x] != 0]
+
     def adaptive_step(self, len_prev_kps):
         """
         Control which images we consider currently
         """
 
         # Keep track of the img window
-        self.img_window.append(self.curr_img)
+        self.img_window.append((self.curr_img, self.curr_features))
 
         # Current length of the window
         len_window = len(self.img_window)
@@ -57,16 +88,29 @@ class Matcher():
             # We observed too many features, make
             # window smaller again
             self.img_window.pop(0)
-            self.prev_img = self.img_window.pop(0)
+            self.prev_img, self.prev_features = self.img_window.pop(0)
 
         else:
             # We observed enough features, advance normally
-            self.prev_img = self.img_window.pop(0)
+            self.prev_img, self.prev_features = self.img_window.pop(0)
 
         #self.prev_kps = self.curr_kps
         #self.prev_desc = self.curr_desc
 
-    def match(self, img):
+    def match(self, img, keypoints=None):
+        raise NotImplementedError
+
+    def match_pair(self, prev_img, curr_img):
+        """
+        Matches two images directly without the adaptive image window. This is used if the frame pairs are
+        distributed over several workers, each of which only ever sees one pair at a time.
+        """
+        self.img_window = list()
+        self.prev_img, self.prev_features = prev_img, None
+        self.prev_kps, self.prev_desc = self.detect(prev_img)
+        return self.match_current(curr_img)
+
+    def match_current(self, img, keypoints=None):
         raise NotImplementedError
 
     def calcTransformation(self, mp1, mp2):
@@ -100,10 +144,10 @@ class Matcher():
 
     def getTransformations(self):
         if self.nb_transform_solutions > 0:
+            # decomposeHomographyMat gives sequences of solutions, recoverPose a single one
             transformations = np.zeros((self.nb_transform_solutions, 3, 4))
-            for i in range(self.nb_transform_solutions):
-                transformations[i, :, 0:3] = self.rotations
-                transformations[i, :, 3] = self.translations.ravel()
+            transformations[:, :, 0:3] = np.reshape(self.rotations, (-1, 3, 3))
+            transformations[:, :, 3] = np.reshape(self.translations, (-1, 3))
             return transformations
         else:
             return np.zeros((1,3,4))
@@ -168,8 +212,15 @@ class bruteForceMatcher(Matcher):
 
         self.matcher = cv2.BFMatcher_create(matching_norm, crossCheck=True)
 
-    def match(self, img):
-        self.curr_img = img
+    def match(self, img, keypoints=None):
+        prev_match_pts, curr_match_pts = self.match_current(img, keypoints)
+
+        self.adaptive_step(len(prev_match_pts))
+
+        return prev_match_pts, curr_match_pts
+
+    def match_current(self, img, keypoints=None):
+        self.curr_img, self.curr_features = img, keypoints
         prev_match_pts, curr_match_pts = self.bruteForceMatching()
 
         prev_match_pts, curr_match_pts = self.binMatches(prev_match_pts, curr_match_pts)
@@ -181,12 +232,10 @@ class bruteForceMatcher(Matcher):
         prev_match_pts = prev_match_pts[mask.ravel().astype(bool)]
         curr_match_pts = curr_match_pts[mask.ravel().astype(bool)]
 
-        self.adaptive_step(len(prev_match_pts))
-
         return prev_match_pts, curr_match_pts
 
     def bruteForceMatching(self):
-        self.curr_kps, self.curr_desc = self.detector.detect(self.curr_img)
+        self.curr_kps, self.curr_desc = self.detect(self.curr_img, self.curr_features)
         matches = self.matcher.match(self.prev_desc, self.curr_desc)
 
         old_match_points = np.array([self.prev_kps[match.queryIdx] for match in matches]).reshape((-1, 2))
@@ -195,15 +244,19 @@ class bruteForceMatcher(Matcher):
         return old_match_points, new_match_points
 
 class opticalFlowMatcher(Matcher):
-    def match(self, img):
+    def match(self, img, keypoints=None):
         # Decide what the new prev img is
         self.adaptive_step(self.len_cheirality)
 
+        return self.match_current(img, keypoints)
+
+    def match_current(self, img, keypoints=None):
         # New curr img is always the new img
-        self.curr_img = img
+        self.curr_img, self.curr_features = img, keypoints
 
         #if self.prev_kps.shape[0] < OF_MIN_NUM_FEATURES:
-        self.prev_kps, _ = self.detector.detect(self.prev_img)
+        prev_kps, _ = self.detect(self.prev_img, self.prev_features)
+        self.prev_kps = self.in_mask(prev_kps)
 
         self.prev_kps, self.curr_kps, diff = self.KLT_featureTracking()
 
@@ -299,21 +352,21 @@ class featureDetector:
         else:
             self.logger.warn(method + "detector is not available")
 
-    def detect(self, img: np.array):
+    def detect(self, img: np.array, mask: np.array = None):
         keypoints = None
         descriptors = None
 
         if self.method == 'SHI-TOMASI':
-            keypoints = cv2.goodFeaturesToTrack(img, **shi_tomasi_params)
+            keypoints = cv2.goodFeaturesToTrack(img, mask=mask, **shi_tomasi_params)
         elif self.method == 'ORB':
-            keypoints = self.detector.detect(img, None)
+            keypoints = self.detector.detect(img, mask)
             keypoints, descriptors = self.detector.compute(img, keypoints)
         elif self.method == 'FAST':
-            keypoints = self.detector.detect(img, None)
+            keypoints = self.detector.detect(img, mask)
         elif self.method == 'REGULAR_GRID':
-            keypoints = self.regular_grid_detector(img)
+            keypoints = self.regular_grid_detector(img, mask)
         else:
-            keypoints, descriptors = self.detector.detectAndCompute(img, None)
+            keypoints, descriptors = self.detector.detectAndCompute(img, mask)
 
 
         self.logger.debug(f"Found {len(keypoints)} feautures")
@@ -323,7 +376,7 @@ class featureDetector:
         keypoints = cv2.undistortPoints(keypoints, self.intrinsic_matrix, self.distortion_coeffs, R=None, P=self.intrinsic_matrix).reshape(-1, 2)
         return (keypoints, descriptors)
 
-    def regular_grid_detector(self, img):
+    def regular_grid_detector(self, img, mask=None):
         """
         Very basic method of just sampling point from a regular grid
         """
@@ -345,6 +398,7 @@ class featureDetector:
 
         for c in range(n_col):
             for r in range(n_rows):
-                features.append(Kp(pt=(c*h_cols, r*h_rows)))
+                if mask is None or mask[r*h_rows, c*h_cols]:
+                    features.append(Kp(pt=(c*h_cols, r*h_rows)))
 
         return features
\ No newline at end of file
@@ -0,0 +1,47 @@
+import queue
+import threading
+import traceback
+from typing import Any, Callable, List, Optional
+
+
+class StagedPipeline:
+    """
+    Runs a chain of stages on a pool of daemon threads, one thread per stage, connected by bounded queues. Every stage
+    consumes the output of the previous one, so consecutive frames are processed by different stages at the same time.
+    Each stage handles its items one after another in FIFO order, therefore the output order matches the input order.
+
+    A stage returns None to drop an item. put blocks while the first queue is full which throttles the producer.
+    """
+    def __init__(self, stages: List[Callable[[Any], Any]], queue_size: int, logger):
+        self.stages = stages
+        self.logger = logger
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.error: Optional[str] = None
+
+        # The stages never return, daemon threads do not keep the module from shutting down
+        self.threads = [threading.Thread(target=self.run_stage, args=(idx,), name=f"stage_{idx}", daemon=True)
+                        for idx in range(len(stages))]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, item: Any):
+        while True:
+            if self.error is not None:
+                raise RuntimeError(f"A pipeline stage failed: {self.error}")
+            try:
+                self.queues[0].put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def run_stage(self, idx: int):
+        try:
+            while True:
+                item = self.queues[idx].get()
+                result = self.stages[idx](item)
+                if result is not None and idx + 1 < len(self.stages):
+                    self.queues[idx + 1].put(result)
+        except Exception:
+            # the producer raises the error on its next put
+            self.error = traceback.format_exc()
+            self.logger.error(self.error)
@@ -0,0 +1,139 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .config import *
+
+STEPS = ("cvtColor", "resize", "clahe", "blur")
+
+
+class StripePreprocessor:
+    """
+    Converts RGB frames to the preprocessed grayscale images used for tracking. The image is split into horizontal
+    stripes which are processed in parallel, OpenCV releases the GIL while it works on a stripe. The blur gives the
+    same result as on the full frame, the CLAHE only approximates it near the stripe borders.
+
+    All intermediate and output images are preallocated and written to through dst=. The matcher keeps references to
+    the images in its window, therefore the outputs are taken from a ring which is larger than the window.
+    """
+    def __init__(self, n_threads: int = PREPROCESSING_THREADS, n_stripes: int = PREPROCESSING_STRIPES,
+                 n_outputs: int = MAX_FRAME_DELTA + 3):
+        assert CLAHE_TILE_GRID[1] % n_stripes == 0, "PREPROCESSING_STRIPES must divide the vertical CLAHE tile count"
+
+        self.executor = ThreadPoolExecutor(max_workers=n_threads, thread_name_prefix="preprocessing")
+        self.n_stripes = n_stripes
+        self.n_outputs = n_outputs
+
+        # CLAHE objects are not thread safe, every stripe gets its own. The tiles have the size of the full frame tiles,
+        # but CLAHE does not interpolate across the stripe borders, so rows near a border differ by a few grey levels
+        # from a full frame CLAHE
+        tile_grid = (CLAHE_TILE_GRID[0], CLAHE_TILE_GRID[1] // n_stripes)
+        self.clahes = [cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=tile_grid) for _ in range(n_stripes)]
+        self.halo = GAUSSIAN_KSIZE[1] // 2
+
+        self.input_shape: Optional[Tuple[int, ...]] = None
+        self.output_shape: Optional[Tuple[int, int]] = None
+        self.stripes: List[Tuple[int, int]] = []
+        self.output_idx = 0
+
+        # duration of every step and stripe of the last frame in seconds
+        self.durations = np.zeros((n_stripes, len(STEPS)))
+        self.wall_time = 0.0
+
+    def allocate(self, input_shape: Tuple[int, ...], resolution: Tuple[int, int]):
+        height, width = resolution[1], resolution[0]
+        self.input_shape = input_shape
+        self.output_shape = (height, width)
+
+        # Stripe boundaries are kept even so that a 2x downscale maps to whole source rows
+        bounds = [2 * round(height * i / (2 * self.n_stripes)) for i in range(self.n_stripes)] + [height]
+        self.stripes = list(zip(bounds[:-1], bounds[1:]))
+
+        self.gray_full = np.empty(input_shape[:2], dtype=np.uint8)
+        self.gray = np.empty(self.output_shape, dtype=np.uint8)
+        self.equalized = np.empty(self.output_shape, dtype=np.uint8)
+        max_stripe_height = max(row_1 - row_0 for row_0, row_1 in self.stripes)
+        self.blur_scratch = [np.empty((max_stripe_height + 2 * self.halo, width), dtype=np.uint8)
+                             for _ in range(self.n_stripes)]
+        self.outputs = [np.empty(self.output_shape, dtype=np.uint8) for _ in range(self.n_outputs)]
+
+    def __call__(self, img_rgb: np.array, resolution: Tuple[int, int], rows: Optional[Tuple[int, int]] = None):
+        """
+        :param img_rgb: the RGB image as published by the drivers module
+        :param resolution: (width, height) of the processed image
+        :param rows: CLAHE and blur are only applied to stripes which overlap these rows. Defaults to all rows.
+        :return: the processed grayscale image. It stays valid until the ring of outputs wraps around.
+        """
+        if img_rgb.shape != self.input_shape or (resolution[1], resolution[0]) != self.output_shape:
+            self.allocate(img_rgb.shape, resolution)
+
+        self.output_idx = (self.output_idx + 1) % self.n_outputs
+        output = self.outputs[self.output_idx]
+        rows = (0, self.output_shape[0]) if rows is None else rows
+
+        start = perf_counter()
+        # Every phase needs the finished rows of the neighbouring stripes from the previous phase
+        list(self.executor.map(lambda i: self.convert_stripe(i, img_rgb), range(self.n_stripes)))
+        equalized = self.equalized if USE_GAUSSIAN else output
+        list(self.executor.map(lambda i: self.equalize_stripe(i, equalized, rows), range(self.n_stripes)))
+        if USE_GAUSSIAN:
+            list(self.executor.map(lambda i: self.blur_stripe(i, output, rows), range(self.n_stripes)))
+        self.wall_time = perf_counter() - start
+
+        return output
+
+    def in_roi(self, i: int, rows: Tuple[int, int]) -> bool:
+        row_0, row_1 = self.stripes[i]
+        return row_0 < rows[1] and row_1 > rows[0]
+
+    def convert_stripe(self, i: int, img_rgb: np.array):
+        row_0, row_1 = self.stripes[i]
+        scale = self.output_shape[0] / self.input_shape[0]
+
+        t0 = perf_counter()
+        if scale == 1.0:
+            cv2.cvtColor(img_rgb[row_0:row_1], cv2.COLOR_RGB2GRAY, dst=self.gray[row_0:row_1])
+            t1 = perf_counter()
+        else:
+            src_0, src_1 = int(round(row_0 / scale)), int(round(row_1 / scale))
+            cv2.cvtColor(img_rgb[src_0:src_1], cv2.COLOR_RGB2GRAY, dst=self.gray_full[src_0:src_1])
+            t1 = perf_counter()
+            cv2.resize(self.gray_full[src_0:src_1], (self.output_shape[1], row_1 - row_0),
+                       dst=self.gray[row_0:row_1], interpolation=cv2.INTER_AREA)
+        t2 = perf_counter()
+
+        self.durations[i, 0] = t1 - t0
+        self.durations[i, 1] = t2 - t1
+
+    def equalize_stripe(self, i: int, equalized: np.array, rows: Tuple[int, int]):
+        row_0, row_1 = self.stripes[i]
+
+        t0 = perf_counter()
+        if USE_CLAHE and self.in_roi(i, rows):
+            self.clahes[i].apply(self.gray[row_0:row_1], dst=equalized[row_0:row_1])
+        else:
+            np.copyto(equalized[row_0:row_1], self.gray[row_0:row_1])
+        self.durations[i, 2] = perf_counter() - t0
+
+    def blur_stripe(self, i: int, output: np.array, rows: Tuple[int, int]):
+        row_0, row_1 = self.stripes[i]
+
+        t0 = perf_counter()
+        if self.in_roi(i, rows):
+            # Blur a slightly larger stripe so that the stripe borders are identical to a full frame blur
+            halo_0, halo_1 = max(row_0 - self.halo, 0), min(row_1 + self.halo, self.output_shape[0])
+            scratch = self.blur_scratch[i][:halo_1 - halo_0]
+            cv2.blur(self.equalized[halo_0:halo_1], GAUSSIAN_KSIZE, dst=scratch)
+            np.copyto(output[row_0:row_1], scratch[row_0 - halo_0:row_1 - halo_0])
+        else:
+            np.copyto(output[row_0:row_1], self.equalized[row_0:row_1])
+        self.durations[i, 3] = perf_counter() - t0
+
+    def timings(self) -> Dict[str, float]:
+        # Critical path of every step in ms, the slowest stripe determines when a step is done
+        timings = {step: 1000.0 * float(duration) for step, duration in zip(STEPS, self.durations.max(axis=0))}
+        timings["total"] = 1000.0 * self.wall_time
+        return timings
@@ -0,0 +1,45 @@
+from typing import Tuple
+
+from .config import *
+
+
+class ResolutionController:
+    """
+    Picks the processing resolution from PROCESSING_RESOLUTIONS based on the smoothed end to end latency.
+    Level 0 is the highest resolution. Switches are rate limited by RESOLUTION_MIN_FRAMES to avoid oscillations.
+    """
+    def __init__(self, resolutions=PROCESSING_RESOLUTIONS, budget_ms: float = LATENCY_BUDGET_MS):
+        self.resolutions = resolutions
+        self.budget_ms = budget_ms
+        self.level = 0
+        self.latency_ms = None
+        self.frames_since_switch = 0
+
+    @property
+    def resolution(self) -> Tuple[int, int]:
+        return self.resolutions[self.level]
+
+    def scale(self, width: int) -> float:
+        # scale from an image with the given width to the processing resolution
+        return self.resolution[0] / width
+
+    def update(self, latency_ms: float) -> bool:
+        # returns True if the processing resolution changed
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms = (1.0 - LATENCY_SMOOTHING) * self.latency_ms + LATENCY_SMOOTHING * latency_ms
+
+        self.frames_since_switch += 1
+        if self.frames_since_switch < RESOLUTION_MIN_FRAMES:
+            return False
+
+        if self.latency_ms > self.budget_ms and self.level < len(self.resolutions) - 1:
+            self.level += 1
+        elif self.latency_ms < LATENCY_RECOVERY_RATIO * self.budget_ms and self.level > 0:
+            self.level -= 1
+        else:
+            return False
+
+        self.frames_since_switch = 0
+        return True
@@ -0,0 +1,68 @@
+from math import atan, tan
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .config import *
+
+
+class RegionOfInterest:
+    """
+    Mask of the image regions that matter for guidance. The ROI is built from boxes in front of the user which are
+    projected into the image. All boxes are nested and shrink towards the vanishing point with increasing distance,
+    so the projection at ROI_MIN_DISTANCE covers them for every larger distance.
+    """
+    def __init__(self, intrinsic_matrix: np.array, masks=ROI_MASKS):
+        self.intrinsic_matrix = intrinsic_matrix
+        self.masks = masks
+        self.pitch = 0.0
+
+        self.mask: Optional[np.array] = None
+        self.rows: Optional[Tuple[int, int]] = None
+        self.horizon_row: Optional[int] = None
+
+    def update_pitch(self, accel_forward: float, accel_down: float):
+        # The ratio cancels out the sign convention of the accelerometer
+        if abs(accel_down) < 1e-6:
+            return
+        pitch = atan(accel_forward / accel_down)
+        self.pitch = (1.0 - ROI_PITCH_SMOOTHING) * self.pitch + ROI_PITCH_SMOOTHING * pitch
+
+    def update(self, shape: Tuple[int, int]) -> np.array:
+        fx, fy = self.intrinsic_matrix[0, 0], self.intrinsic_matrix[1, 1]
+        cx, cy = self.intrinsic_matrix[0, 2], self.intrinsic_matrix[1, 2]
+
+        # A camera pitched downwards moves the horizon up in the image
+        horizon_row = int(round(cy - fy * tan(self.pitch)))
+        if self.mask is not None and self.mask.shape == shape and horizon_row == self.horizon_row:
+            return self.mask
+
+        height, width = shape
+        self.mask = np.zeros(shape, dtype=np.uint8)
+        self.horizon_row = horizon_row
+
+        above = fy * (ROI_HEAD_HEIGHT - ROI_CAMERA_HEIGHT) / ROI_MIN_DISTANCE
+        top = self.clip(horizon_row - above, height)
+
+        if 'CORRIDOR' in self.masks:
+            half_width = fx * ROI_CORRIDOR_HALF_WIDTH / ROI_MIN_DISTANCE
+            bottom = self.clip(horizon_row + fy * ROI_CAMERA_HEIGHT / ROI_MIN_DISTANCE, height)
+            self.mask[top:bottom, self.clip(cx - half_width, width):self.clip(cx + half_width, width)] = 255
+
+        if 'ABOVE_WAIST' in self.masks:
+            bottom = self.clip(horizon_row + fy * (ROI_CAMERA_HEIGHT - ROI_WAIST_HEIGHT) / ROI_MIN_DISTANCE, height)
+            self.mask[top:bottom, :] = 255
+
+        rows = np.flatnonzero(self.mask.any(axis=1))
+        if rows.size > 0:
+            self.rows = (int(rows[0]), int(rows[-1]) + 1)
+        else:
+            # The boxes are outside of the image for extreme pitch angles, fall back to the full frame
+            self.mask[:] = 255
+            self.rows = (0, height)
+
+        return self.mask
+
+    @staticmethod
+    def clip(value: float, upper: int) -> int:
+        return int(min(max(round(value), 0), upper))
@@ -5,9 +5,11 @@ import traceback
 import queue
 import time
 
-from typing import Optional, Any, Dict, List, Tuple, Callable, Union
+from typing import Optional, Any, Dict, List, Set, Tuple, Callable, Union
 
-from ..utils import get_logger, INTRINSIC_MATRIX, DISTORTION_COEFFS
+from ..messages import Envelope, Message
+from ..serialization import Encoded, MessageCodec, SharedArena, PROTOCOL
+from ..utils import get_logger, SharedFrameRing, INTRINSIC_MATRIX, DISTORTION_COEFFS
 
 
 class ModuleService:
@@ -35,15 +37,44 @@ class ModuleService:
 
 class Module:
     def __init__(self, name: str, log_dir: pathlib.Path, outputs: List[Tuple[str, int]] = None,
-                 inputs: List[str] = None, services: List[str] = None, requests: List[str] = None):
+                 inputs: List[Union[str, Tuple[str, int]]] = None, services: List[str] = None,
+                 requests: List[str] = None, taps: List[str] = None, schemas: Dict[str, type] = None):
 
         self.name: str = name
         self.log_dir: pathlib.Path = log_dir
         self.log_level = logging.DEBUG
 
-        self.inputs: Dict[str, Optional[mp.Queue]] = {} if inputs is None else {channel: None for channel in inputs}
+        # An input can be declared as (channel, budget). The producer then publishes a reduced copy of every message
+        # to this subscriber, see Module.reduce. The budget is interpreted by the producer, e.g. a number of points.
+        inputs = [] if inputs is None else [(spec, None) if isinstance(spec, str) else spec for spec in inputs]
+        self.inputs: Dict[str, Optional[mp.Queue]] = {channel: None for channel, _ in inputs}
+        self.input_budgets: Dict[str, int] = {channel: budget for channel, budget in inputs if budget is not None}
+        # Taps receive a copy of every message of a channel without taking them away from its other subscribers
+        self.taps: List[str] = [] if taps is None else list(taps)
+        self.inputs.update({channel: None for channel in self.taps})
         self.outputs: Dict[str, mp.Queue] = {} if outputs is None else \
             {name: mp.Queue(maxsize=maxsize) for (name, maxsize) in outputs}
+        # output name -> budget -> queue of the reduced messages
+        self.budgeted_outputs: Dict[str, Dict[int, mp.Queue]] = {}
+        self.tapped_outputs: Dict[str, List[mp.Queue]] = {}
+        # Outputs read by a plain subscriber, nothing is sent to the queues of the other outputs
+        self.subscribed_outputs: Set[str] = set()
+
+        # Message types of the outputs (by output name) and of the inputs (by channel), see messages.py. The pipeline
+        # checks at startup that the producer of an input publishes what its consumer expects.
+        self.schemas: Dict[str, type] = {} if schemas is None else dict(schemas)
+        # Typed outputs with arena_bytes > 0 send their large buffers through shared memory instead of the queues
+        self.arenas: Dict[str, SharedArena] = {name: SharedArena(self.schemas[name].arena_bytes)
+                                               for name in self.outputs
+                                               if name in self.schemas and self.schemas[name].arena_bytes > 0
+                                               and PROTOCOL >= 5}
+        self.codecs: Dict[str, MessageCodec] = {name: MessageCodec(arena) for name, arena in self.arenas.items()}
+        self.input_codecs: Dict[str, MessageCodec] = {}
+
+        # Large images are not sent through the queues. A module can keep them in a shared frame ring and publish
+        # their frame ids instead, its subscribers read them with get_frame.
+        self.frame_ring: Optional[SharedFrameRing] = None
+        self.frame_sources: Dict[str, SharedFrameRing] = {}
 
         self.requests: Dict[str, Dict[str, mp.Queue]] = {} if requests is None else \
             {channel: {} for channel in requests}
@@ -52,13 +83,42 @@ class Module:
 
         self.request_timeout = 1  # seconds
 
+        # Modules which implement start_worker can be run with a pool of worker processes
+        self.workers = 1
+        self.worker_id: Optional[int] = None
+
         self.intrinsic_matrix = INTRINSIC_MATRIX
 
         self.distortion_coeffs = DISTORTION_COEFFS
 
-    def subscribe(self, channel: str, queue_obj: mp.Queue):
+    def subscribe(self, channel: str, queue_obj: mp.Queue, arena: Optional[SharedArena] = None):
+        if arena is not None:
+            self.input_codecs[channel] = MessageCodec(arena)
         return self.inputs.update({channel: queue_obj})
 
+    def add_frame_source(self, module_name: str, frame_ring: SharedFrameRing):
+        self.frame_sources.update({module_name: frame_ring})
+
+    def get_frame(self, module_name: str, frame_id: int) -> Optional[Any]:
+        # Returns a copy of the frame or None if it was already overwritten
+        return self.frame_sources[module_name].read(frame_id)
+
+    def add_budgeted_output(self, channel: str, budget: int) -> mp.Queue:
+        # Subscribers with the same budget share the queue. Only the latest reduced message is kept.
+        budgets = self.budgeted_outputs.setdefault(channel, {})
+        if budget not in budgets:
+            budgets[budget] = mp.Queue(maxsize=1)
+        return budgets[budget]
+
+    def add_subscriber(self, channel: str) -> mp.Queue:
+        self.subscribed_outputs.add(channel)
+        return self.outputs[channel]
+
+    def add_tap(self, channel: str, maxsize: int = 100) -> mp.Queue:
+        tap = mp.Queue(maxsize=maxsize)
+        self.tapped_outputs.setdefault(channel, []).append(tap)
+        return tap
+
     def add_request_target(self, request_channel, request_queue, response_queue):
         self.requests.update({request_channel: {"requests": request_queue, "responses": response_queue}})
 
@@ -67,20 +127,48 @@ class Module:
             # We need to set the timestamp if not set explicitly
             timestamp = self.get_time_ms()
 
+        schema = self.schemas.get(channel)
+        if schema is not None and not isinstance(data, schema):
+            raise TypeError(f"{self.name}:{channel} publishes {schema.__name__}, got {type(data).__name__}")
+
+        # The output and taps share the envelope, the buffers in the arena are only written once. A queue without a
+        # reader would still pickle every message in its feeder thread, so unread outputs are skipped.
+        receivers = self.tapped_outputs.get(channel, [])
+        if channel in self.subscribed_outputs:
+            receivers = [self.outputs[channel]] + receivers
+        if receivers:
+            envelope = Envelope(self.encode(channel, data), timestamp, validity)
+            for output in receivers:
+                self.put_latest(output, envelope)
+
+        for budget, output in self.budgeted_outputs.get(channel, {}).items():
+            self.put_latest(output, Envelope(self.encode(channel, self.reduce(channel, data, budget)), timestamp,
+                                             validity))
+
+    def encode(self, channel: str, data: Any) -> Any:
+        return self.codecs[channel].encode(data) if channel in self.codecs else data
+
+    @staticmethod
+    def put_latest(output: mp.Queue, msg_body: Envelope):
+        # drops the oldest messages if the queue is full
         while True:
             try:
-                self.outputs[channel].put_nowait({'data': data, 'timestamp': timestamp, 'validity': validity})
+                output.put_nowait(msg_body)
                 break
             except queue.Full:
                 try:
-                    self.outputs[channel].get_nowait()
+                    output.get_nowait()
                 except queue.Empty:
                     pass
 
+    def reduce(self, channel: str, data: Any, budget: int) -> Any:
+        # Modules whose outputs are subscribed with a budget must override this
+        raise NotImplementedError(f"Module {self.name} does not support budgeted subscriptions of {channel}")
+
     def get(self, channel: str) -> Dict:
         # If the queue is empty we return an empty dict, error handling should be done after
 
-        def is_valid(msg_body_item: Dict):
+        def is_valid(msg_body_item: Envelope):
             valid = msg_body_item is not None and msg_body_item['timestamp'] + \
                    msg_body_item['validity'] > self.get_time_ms()
 
@@ -99,6 +187,11 @@ class Module:
                 # if the queue is empty queue.Empty will be raised.
                 msg_body = self.inputs[channel].get_nowait()
                 if is_valid(msg_body):
+                    if isinstance(msg_body.data, Encoded):
+                        msg_body.data = self.input_codecs[channel].decode(msg_body.data)
+                        if msg_body.data is None:
+                            # the buffers were overwritten, this subscriber lags too far behind
+                            continue
                     return msg_body
         except queue.Empty:
             return dict()
@@ -151,16 +244,24 @@ class Module:
         else:
             raise full_exc
 
+    def set_workers(self, workers: int):
+        # Called before the processes are started. Shared resources for the workers must be created here.
+        self.workers = workers
+
     def start(self):
         raise NotImplementedError
 
+    def start_worker(self, worker_id: int):
+        raise NotImplementedError
+
     @staticmethod
     def get_time_ms():
         # https://www.python.org/dev/peps/pep-0418/#time-monotonic
         return float(round(time.monotonic() * 1000, 3))
 
     def __enter__(self):
-        self.logger: logging.Logger = get_logger(f"module_{self.name}", self.log_dir, level=self.log_level)
+        logger_name = f"module_{self.name}" if self.worker_id is None else f"module_{self.name}_worker_{self.worker_id}"
+        self.logger: logging.Logger = get_logger(logger_name, self.log_dir, level=self.log_level)
         for service in self.services.values():
             service.logger = self.logger.getChild(f"service_{service.name}")
         self.logger.info(f"Module {self.name} started.")
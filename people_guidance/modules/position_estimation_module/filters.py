@@ -0,0 +1,64 @@
+from typing import Optional
+
+import numpy as np
+from scipy import signal
+
+
+class RunningMeanFilter:
+    """
+    Moving average over the last window samples of several channels. The samples are kept in a ring and the sum of
+    the window is updated with the newest and the oldest sample, so a step costs the same for any window length.
+    """
+    def __init__(self, n_channels: int, window: int):
+        self.ring = np.zeros((window, n_channels), dtype=np.float64)
+        self.sum = np.zeros(n_channels, dtype=np.float64)
+        self.out = np.zeros(n_channels, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+
+    def __call__(self, values: np.array) -> np.array:
+        """
+        :param values: (n_channels,) newest sample
+        :return: (n_channels,) mean of the window, overwritten by the next call
+        """
+        self.sum -= self.ring[self.head]
+        self.ring[self.head] = values
+        self.sum += self.ring[self.head]
+
+        self.head = (self.head + 1) % self.ring.shape[0]
+        self.count = min(self.count + 1, self.ring.shape[0])
+        if self.head == 0:
+            # the rounding errors of the running sum are dropped once per pass through the ring
+            np.sum(self.ring, axis=0, out=self.sum)
+        return np.divide(self.sum, self.count, out=self.out)
+
+
+class LinearFilter:
+    """
+    IIR or FIR filter with the coefficients b, a of scipy.signal, applied to several channels one sample at a time.
+    The state of scipy.signal.lfilter is kept between the calls and starts in the steady state of the first sample.
+    """
+    def __init__(self, n_channels: int, b: np.array, a: np.array):
+        self.b = np.asarray(b, dtype=np.float64)
+        self.a = np.asarray(a, dtype=np.float64)
+        self.zi_step = signal.lfilter_zi(self.b, self.a)
+        self.n_channels = n_channels
+        self.zi: Optional[np.array] = None
+
+    def __call__(self, values: np.array) -> np.array:
+        # (n_channels,) -> (n_channels,)
+        x = np.asarray(values, dtype=np.float64).reshape(self.n_channels, 1)
+        if self.zi is None:
+            self.zi = self.zi_step[None, :] * x
+        y, self.zi = signal.lfilter(self.b, self.a, x, axis=1, zi=self.zi)
+        return y[:, 0]
+
+
+def butterworth_filter(n_channels: int, order: int, cutoff_hz: float, sample_hz: float) -> LinearFilter:
+    b, a = signal.butter(order, cutoff_hz, btype="low", fs=sample_hz)
+    return LinearFilter(n_channels, b, a)
+
+
+def exponential_filter(n_channels: int, alpha: float) -> LinearFilter:
+    # y[n] = alpha * x[n] + (1 - alpha) * y[n - 1]
+    return LinearFilter(n_channels, [alpha], [1.0, alpha - 1.0])
@@ -1,9 +1,16 @@
-from typing import List
-from collections import Sequence
+from typing import Dict, Union
+
+import numpy as np
+
+POSITION_FIELDS = ("ts", "x", "y", "z", "roll", "pitch", "yaw")
+# All fields are float64, so the records can also be viewed as a (n, 7) float array
+POSITION_DTYPE = np.dtype([(name, "<f8") for name in POSITION_FIELDS])
+
 
 class Position:
+    __slots__ = POSITION_FIELDS
+
     def __init__(self, ts, x, y, z, roll, pitch, yaw):
-        super().__init__()
         self.ts = ts
         self.x = x
         self.y = y
@@ -13,24 +20,74 @@ class Position:
         self.yaw = yaw
 
     def __getitem__(self, item):
-        return self.__dict__[item]
+        return getattr(self, item)
+
+    def as_tuple(self):
+        return tuple(getattr(self, name) for name in POSITION_FIELDS)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: getattr(self, name) for name in POSITION_FIELDS}
+
+    @classmethod
+    def from_record(cls, record: np.void) -> "Position":
+        return cls(*(float(value) for value in record.tolist()))
 
     def __str__(self):
-        return "Position: " + str(self.__dict__)
+        return "Position: " + str(self.as_dict())
+
+
+class PositionRing:
+    """
+    The last capacity positions in a structured array. Appending copies the values of a position into the ring, no
+    objects are kept.
+    """
+    def __init__(self, capacity: int):
+        self.records = np.zeros(capacity, dtype=POSITION_DTYPE)
+        self.head = 0  # index of the next record
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, position: Position):
+        self.records[self.head] = position.as_tuple()
+        self.head = (self.head + 1) % self.records.shape[0]
+        self.count = min(self.count + 1, self.records.shape[0])
+
+    def ordered(self) -> np.array:
+        # the records from the oldest to the newest, a view unless the ring has wrapped
+        if self.count < self.records.shape[0]:
+            return self.records[:self.count]
+        return np.concatenate((self.records[self.head:], self.records[:self.head]))
+
+    def interpolate(self, timestamps: Union[float, np.array]) -> np.array:
+        """
+        Linear interpolation of all fields at the given timestamps in one pass. Timestamps outside of the tracked
+        interval get the oldest or the newest position.
+        :return: records of POSITION_DTYPE with the shape of timestamps
+        """
+        if self.count == 0:
+            raise ValueError("No positions were tracked")
+
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        values = self.ordered().view(np.float64).reshape(-1, len(POSITION_FIELDS))
+        ts = values[:, 0]
 
+        upper = np.clip(np.searchsorted(ts, timestamps.ravel(), side="right"), 1, max(1, self.count - 1))
+        lower = upper - 1
+        upper = np.minimum(upper, self.count - 1)
+        span = ts[upper] - ts[lower]
+        # equal timestamps give the upper position like the scalar version did
+        lever = np.divide(timestamps.ravel() - ts[lower], span, out=np.ones_like(span), where=span != 0)
+        lever = np.clip(lever, 0.0, 1.0)[:, None]
 
-def new_interpolated_position(timestamp, position0: Position, position1: Position):
+        interpolated = values[lower] + (values[upper] - values[lower]) * lever
+        interpolated[:, 0] = timestamps.ravel()
+        return interpolated.view(POSITION_DTYPE).reshape(timestamps.shape)
 
-    if position1.ts == position0.ts:
-        return position1
-    else:
-        lever = (timestamp - position0.ts) / (position1.ts - position0.ts)
 
-        properties = {"ts": timestamp}
-        for key in ["x", "y", "z", "roll", "pitch", "yaw"]:
-            value = position0[key] + ((position1[key] - position0[key]) * lever)
-            properties[key] = value
-        return Position(**properties)
+def new_interpolated_position(timestamp, positions: PositionRing) -> Position:
+    return Position.from_record(positions.interpolate(timestamp))
 
 
 def new_empty_position():
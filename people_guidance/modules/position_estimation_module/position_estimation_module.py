@@ -9,16 +9,18 @@ import numpy as np
 from typing import List, Optional, Dict
 from queue import Queue
 from pathlib import Path
-import copy
 import collections
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 
 from .utils import *
+from .filters import RunningMeanFilter, butterworth_filter, exponential_filter
+from .rotation import euler_to_matrix
 from ..drivers_module import ACCEL_G
 from ..module import Module
+from ...messages import IMUData, PositionData
 from ...utils import DEFAULT_DATASET
-from .position import Position, new_empty_position, new_interpolated_position
+from .position import Position, PositionRing, new_empty_position, new_interpolated_position
 
 RAD_TO_DEG = 180.0/pi
 DEG_TO_RAD = pi/180.0
@@ -30,11 +32,13 @@ class PositionEstimationModule(Module):
         super(PositionEstimationModule, self).__init__(name="position_estimation_module",
                                                        outputs=[("position_vis", 10)],
                                                        inputs=["drivers_module:accelerations"],
-                                                       log_dir=log_dir)
+                                                       log_dir=log_dir,
+                                                       schemas={"position_vis": PositionData,
+                                                                "drivers_module:accelerations": IMUData})
         self.args = args
 
         self.pos: Position = new_empty_position()
-        self.tracked_positions: List[Position] = []
+        self.tracked_positions = PositionRing(TRACKED_POSITIONS)
         self.prev_imu_frame: Optional[IMUFrame] = None
         self.last_visualized_pos: Optional[Position] = None
 
@@ -45,8 +49,14 @@ class PositionEstimationModule(Module):
         self.counter_same_request = 0
 
     def start(self):
-        # Contains window of raw accel data
-        self.data_raw = {var: list() for var in ["accel_x", "accel_y", "accel_z", "gyro_x", "gyro_y", "gyro_z"]}
+        # Filters the accelerations and the angular rates in rad/s of a frame together
+        self.low_pass_filter = self.new_low_pass_filter()
+        self.gyro_scale = np.array([1.0, 1.0, 1.0, DEG_TO_RAD, DEG_TO_RAD, DEG_TO_RAD])
+
+        # Reused by every step of the position estimation
+        self.rotation = np.empty((3, 3), dtype=np.float64)
+        self.accel_imu = np.empty(3, dtype=np.float64)
+        self.accel_w = np.empty(3, dtype=np.float64)
 
         # Low pass filtered sensor values
         self.accel_x_lp = 0.0 # IMU Frame low pass filtered accel x data
@@ -82,7 +92,9 @@ class PositionEstimationModule(Module):
                     self.position_estimation_simple(frame, dt)
 
                     # Publish to visualizer
-                    self.publish("position_vis", self.pos.__dict__, POS_VALIDITY_MS)
+                    self.publish("position_vis", PositionData(x=self.pos.x, y=self.pos.y, z=self.pos.z,
+                                                              roll=self.pos.roll, pitch=self.pos.pitch,
+                                                              yaw=self.pos.yaw), POS_VALIDITY_MS)
 
                     # Save last frame
                     self.prev_imu_frame = frame
@@ -95,16 +107,20 @@ class PositionEstimationModule(Module):
 
             self.handle_requests()
 
-    def apply_low_pass_filters(self, frame):
-        # Low pass filter accel data
-        self.accel_x_lp = self.low_pass(frame.ax, self.data_raw["accel_x"])
-        self.accel_y_lp = self.low_pass(frame.ay, self.data_raw["accel_y"])
-        self.accel_z_lp = self.low_pass(frame.az, self.data_raw["accel_z"])
+    @staticmethod
+    def new_low_pass_filter():
+        if LOW_PASS_METHOD == "butterworth":
+            return butterworth_filter(6, LP_ORDER, LP_CUTOFF_HZ, IMU_RATE_HZ)
+        elif LOW_PASS_METHOD == "exponential":
+            return exponential_filter(6, LP_ALPHA)
+        # the window includes the newest sample on top of LP_LEN older ones
+        return RunningMeanFilter(6, LP_LEN + 1)
 
-        # Low pass filter gyro data
-        self.gyro_x_lp = self.low_pass(frame.gx, self.data_raw["gyro_x"], is_degrees=True)
-        self.gyro_y_lp = self.low_pass(frame.gy, self.data_raw["gyro_y"], is_degrees=True)
-        self.gyro_z_lp = self.low_pass(frame.gz, self.data_raw["gyro_z"], is_degrees=True)
+    def apply_low_pass_filters(self, frame):
+        # all six axes in one step, the gyro data is converted to rad/s first
+        values = np.multiply(frame[:6], self.gyro_scale)
+        (self.accel_x_lp, self.accel_y_lp, self.accel_z_lp,
+         self.gyro_x_lp, self.gyro_y_lp, self.gyro_z_lp) = self.low_pass_filter(values).tolist()
 
     def complementary_filter(self, frame: IMUFrame, dt: float):
         # Pitch and roll based on accel
@@ -126,11 +142,15 @@ class PositionEstimationModule(Module):
         self.pos.yaw += yaw_gyro*dt
 
     def position_estimation_simple(self, frame, dt: float):
-        # Obtain rotation matrix
-        r = R.from_euler('xyz', [-self.pos.roll, -self.pos.pitch, -self.pos.yaw], degrees=False)
+        self.accel_imu[0], self.accel_imu[1], self.accel_imu[2] = frame.az, frame.ay, frame.ax
 
         # Rotate accelerations to world coordinate system
-        accel_w = r.apply([frame.az, frame.ay, frame.ax])
+        if METHOD_SCIPY_ROTATION:
+            r = R.from_euler('xyz', [-self.pos.roll, -self.pos.pitch, -self.pos.yaw], degrees=False)
+            accel_w = r.apply(self.accel_imu)
+        else:
+            euler_to_matrix(-self.pos.roll, -self.pos.pitch, -self.pos.yaw, out=self.rotation)
+            accel_w = np.dot(self.rotation, self.accel_imu, out=self.accel_w)
 
         # Integrate to get the position
         self.pos.x += 0.5*accel_w[0] * dt * dt
@@ -141,15 +161,9 @@ class PositionEstimationModule(Module):
     @staticmethod
     def frame_from_input_data(input_data: Dict) -> IMUFrame:
         # In Camera coordinates: Z = X_IMU, X = -Z_IMU, Y = Y_IMU (90° rotation around the Y axis)
-        return IMUFrame(
-            ax=float(input_data['data']['accel_x']),
-            ay=float(input_data['data']['accel_y']),
-            az=float(input_data['data']['accel_z']),
-            gx=float(input_data['data']['gyro_x']),
-            gy=float(input_data['data']['gyro_y']),
-            gz=float(input_data['data']['gyro_z']),
-            ts=input_data['data']['timestamp']
-        )
+        data: IMUData = input_data['data']
+        return IMUFrame(float(data.accel_x), float(data.accel_y), float(data.accel_z), float(data.gyro_x),
+                        float(data.gyro_y), float(data.gyro_z), data.timestamp)
 
     def visualize_locally(self):
         curr_time = monotonic()
@@ -164,26 +178,5 @@ class PositionEstimationModule(Module):
                                     plot_angles=True, plot_acc_input=True, plot_acc_transformed=True)
 
     def track_positions(self):
-        self.tracked_positions.append(copy.deepcopy(self.pos))
-        if len(self.tracked_positions) > 300:
-            self.tracked_positions.pop(0)
-
-    def low_pass(self, val, data_raw, max_len=LP_LEN, is_degrees=False):
-        val = float(val)
-
-        # If it is in degrees, convert to radians
-        if is_degrees:
-            val = val*DEG_TO_RAD
-
-        # Only keep LP_LEN data points
-        if len(data_raw) > max_len:
-            del data_raw[0]
-        data_raw.append(val)
-
-        # Calculate mean of current window
-        val_lp = 0.0
-        for v in data_raw:
-            val_lp += v
-        val_lp /= len(data_raw)
-
-        return val_lp
+        # the values are copied into the ring, self.pos can be updated in place
+        self.tracked_positions.append(self.pos)
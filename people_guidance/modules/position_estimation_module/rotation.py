@@ -0,0 +1,50 @@
+from math import cos, sin
+from typing import Optional
+
+import numpy as np
+
+
+def euler_to_matrix(x: float, y: float, z: float, out: Optional[np.array] = None) -> np.array:
+    """
+    Rotation matrix of the extrinsic rotations about x, then y, then z in radians, the same as
+    scipy's Rotation.from_euler('xyz', [x, y, z]).as_matrix() without building a Rotation object.
+    :param out: (3, 3) float64 destination, allocated if not given
+    """
+    if out is None:
+        out = np.empty((3, 3), dtype=np.float64)
+    cx, sx, cy, sy, cz, sz = cos(x), sin(x), cos(y), sin(y), cos(z), sin(z)
+    # R = Rz(z) Ry(y) Rx(x)
+    out[0, 0], out[0, 1], out[0, 2] = cz * cy, cz * sy * sx - sz * cx, cz * sy * cx + sz * sx
+    out[1, 0], out[1, 1], out[1, 2] = sz * cy, sz * sy * sx + cz * cx, sz * sy * cx - cz * sx
+    out[2, 0], out[2, 1], out[2, 2] = -sy, cy * sx, cy * cx
+    return out
+
+
+def euler_to_matrices(angles: np.array, out: Optional[np.array] = None) -> np.array:
+    """
+    Block version of euler_to_matrix.
+    :param angles: (N, 3) x, y, z angles in radians
+    :param out: (N, 3, 3) float64 destination, allocated if not given
+    """
+    angles = np.asarray(angles, dtype=np.float64).reshape(-1, 3)
+    if out is None:
+        out = np.empty((angles.shape[0], 3, 3), dtype=np.float64)
+    c, s = np.cos(angles), np.sin(angles)
+    cx, cy, cz = c.T
+    sx, sy, sz = s.T
+
+    out[:, 0, 0] = cz * cy
+    out[:, 0, 1] = cz * sy * sx - sz * cx
+    out[:, 0, 2] = cz * sy * cx + sz * sx
+    out[:, 1, 0] = sz * cy
+    out[:, 1, 1] = sz * sy * sx + cz * cx
+    out[:, 1, 2] = sz * sy * cx - cz * sx
+    out[:, 2, 0] = -sy
+    out[:, 2, 1] = cy * sx
+    out[:, 2, 2] = cy * cx
+    return out
+
+
+def rotate_block(matrices: np.array, vectors: np.array, out: Optional[np.array] = None) -> np.array:
+    # (N, 3, 3) rotations applied to (N, 3) vectors row by row in a single einsum
+    return np.einsum("nij,nj->ni", matrices, vectors, out=out)
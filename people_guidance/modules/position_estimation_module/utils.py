@@ -5,9 +5,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 
+# namedtuples have no __dict__, a frame is as compact as a tuple of its values
 IMUFrame = collections.namedtuple("IMUFrame", ["ax", "ay", "az", "gx", "gy", "gz", "ts"])
 
-# Method for the rotation matrix
+# Method for the rotation matrix, scipy's Rotation instead of the closed form in rotation.py
 METHOD_SCIPY_ROTATION = False
 
 # Debug mode
@@ -28,6 +29,16 @@ POSITION_PUBLISH_INPUT_FREQ = 0
 # Requests
 TRACK_FOR_REQUEST_POSITION_NUMBER_ELT_KEEP = 200
 
+# Capacity of the ring of tracked positions
+TRACKED_POSITIONS = 300
+
+# Low pass filter of the IMU data: "mean" over the last LP_LEN samples, "butterworth" or "exponential"
+LOW_PASS_METHOD = "mean"
+IMU_RATE_HZ = 100  # sample rate the butterworth filter is designed for
+LP_ORDER = 2
+LP_CUTOFF_HZ = 5.0
+LP_ALPHA = 0.05  # weight of the newest sample in the exponential filter
+
 # Complementary filter parameter
 ALPHA_CF = 0.4
 
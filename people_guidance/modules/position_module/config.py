@@ -0,0 +1,22 @@
+import numpy as np
+
+# Scale of the visual odometry translation: 'fusion' (visual-inertial filter), 'absolute', 'relative', 'approx' or
+# 'groundtruth'
+USE_SCALE = 'fusion'
+
+# Correction: the visual odometry gives results rotated from our camera coordinate frame, x_camera = V x_opencv
+VO_TO_CAMERA = np.array([[0, 0, -1], [1, 0, 0], [0, 1, 0]])
+
+# Visual-inertial filter, see fusion.py. Noise densities of the continuous model
+FUSION_ACCEL_NOISE = 0.5  # m/s^2/sqrt(Hz), filtered accelerations after the gravity compensation
+FUSION_BIAS_NOISE = 0.05  # m/s^3/sqrt(Hz), drift of the acceleration bias
+FUSION_SPEED_NOISE = 0.3  # m/s/sqrt(s), change of the walking speed
+FUSION_DIRECTION_NOISE = 0.05  # m, per axis, displacement across the direction measured by the visual odometry
+FUSION_INITIAL_SPEED = 1.0  # m/s
+FUSION_INITIAL_STD = np.array([0.01, 0.01, 0.01, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 1.0])
+# Mahalanobis distance squared above which a camera measurement is rejected, 99% of chi2 with 3 degrees of freedom
+FUSION_GATE = 11.34
+
+# Selection of the visual odometry candidate [R|t], see selection.py
+POSE_ROTATION_SIGMA = 0.1  # rad, tolerated difference to the rotation integrated by the IMU
+POSE_MAX_POINTS = 200  # matches used for the cheirality test, subsampled evenly above this
@@ -0,0 +1,173 @@
+from typing import Optional
+
+import numpy as np
+
+from .config import *
+
+# Error state: displacement since the last camera frame, velocity, acceleration bias (all in the world frame) and the
+# walking speed along the direction measured by the visual odometry
+N_STATES = 10
+D, V, B, S = slice(0, 3), slice(3, 6), slice(6, 9), 9
+AXES = np.arange(3)
+
+
+def quaternions_to_matrices(quaternions: np.array) -> np.array:
+    # (N, 4) [w, x, y, z] -> (N, 3, 3), R(q) v is the rotation q v q* of helpers.quaternion_apply
+    q = np.asarray(quaternions, dtype=np.float64).reshape(-1, 4)
+    q = q / np.linalg.norm(q, axis=1, keepdims=True)
+    w, x, y, z = q.T
+    matrices = np.empty((q.shape[0], 3, 3), dtype=np.float64)
+    matrices[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    matrices[:, 0, 1] = 2 * (x * y - z * w)
+    matrices[:, 0, 2] = 2 * (x * z + y * w)
+    matrices[:, 1, 0] = 2 * (x * y + z * w)
+    matrices[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    matrices[:, 1, 2] = 2 * (y * z - x * w)
+    matrices[:, 2, 0] = 2 * (x * z - y * w)
+    matrices[:, 2, 1] = 2 * (y * z + x * w)
+    matrices[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return matrices
+
+
+def to_world(vectors: np.array, quaternions: np.array) -> np.array:
+    # The quaternions of the complementary filter rotate the world into the IMU frame, R(q)^T takes vectors back
+    return np.einsum("nji,nj->ni", quaternions_to_matrices(quaternions), vectors)
+
+
+class VisualInertialFilter:
+    """
+    Error-state Kalman filter which gives the translations of the visual odometry a metric scale.
+
+    Between two camera frames the gravity compensated accelerations are integrated into the displacement d. At a
+    camera frame the visual odometry measures the direction u of the motion, which is modelled as d = s * T * u with the
+    walking speed s and the time T between the frames. The metric length of the translation is s * T.
+
+    All matrices are allocated once. The IMU samples between two camera frames are propagated as one block: the
+    nominal state is integrated with a few vector operations and the covariance with the closed-form transition and
+    noise of the whole interval, so the cost of a camera frame does not depend on the IMU rate. The update uses the
+    Joseph form, which keeps the covariance symmetric and positive definite.
+    """
+    def __init__(self, accel_noise: float = FUSION_ACCEL_NOISE, bias_noise: float = FUSION_BIAS_NOISE,
+                 speed_noise: float = FUSION_SPEED_NOISE, direction_noise: float = FUSION_DIRECTION_NOISE,
+                 gate: float = FUSION_GATE):
+        self.q_accel = accel_noise ** 2
+        self.q_bias = bias_noise ** 2
+        self.q_speed = speed_noise ** 2
+        self.gate = gate
+
+        self.x = np.zeros(N_STATES)
+        self.x[S] = FUSION_INITIAL_SPEED
+        self.P = np.diag(FUSION_INITIAL_STD ** 2)
+        self.ts: Optional[float] = None  # ms, time of the last propagation
+
+        self.F = np.eye(N_STATES)
+        self.Q = np.zeros((N_STATES, N_STATES))
+        self.H = np.zeros((3, N_STATES))
+        self.H[AXES, AXES] = 1.0
+        self.R = np.eye(3) * direction_noise ** 2
+
+        # scratch space of the propagation and the update
+        self.FP = np.empty((N_STATES, N_STATES))
+        self.PHt = np.empty((N_STATES, 3))
+        self.innovation_cov = np.empty((3, 3))
+        self.K = np.empty((N_STATES, 3))
+        self.IKH = np.empty((N_STATES, N_STATES))
+        self.KR = np.empty((N_STATES, 3))
+        self.innovation = np.empty(3)
+
+    @property
+    def speed(self) -> float:
+        return float(self.x[S])
+
+    def transition(self, T: float):
+        # Fills F and Q for an interval of T seconds, per axis d' = v, v' = a - b + w_a, b' = w_b and s' = w_s
+        F, Q = self.F, self.Q
+        F[AXES, AXES + 3] = T
+        F[AXES, AXES + 6] = -T * T / 2
+        F[AXES + 3, AXES + 6] = -T
+
+        qa, qb = self.q_accel, self.q_bias
+        T2, T3 = T * T, T * T * T
+        Q.fill(0.0)
+        Q[AXES, AXES] = qa * T3 / 3 + qb * T2 * T3 / 20
+        Q[AXES, AXES + 3] = Q[AXES + 3, AXES] = qa * T2 / 2 + qb * T2 * T2 / 8
+        Q[AXES, AXES + 6] = Q[AXES + 6, AXES] = -qb * T3 / 6
+        Q[AXES + 3, AXES + 3] = qa * T + qb * T3 / 3
+        Q[AXES + 3, AXES + 6] = Q[AXES + 6, AXES + 3] = -qb * T2 / 2
+        Q[AXES + 6, AXES + 6] = qb * T
+        Q[S, S] = self.q_speed * T
+
+    def propagate_covariance(self, T: float):
+        self.transition(T)
+        np.dot(self.F, self.P, out=self.FP)
+        np.dot(self.FP, self.F.T, out=self.P)
+        self.P += self.Q
+
+    def propagate(self, accelerations: np.array, timestamps: np.array):
+        """
+        :param accelerations: (N, 3) gravity compensated accelerations in the world frame, each one is held over the
+                              interval which ends at its timestamp
+        :param timestamps: (N,) ms, sorted and later than the last propagation
+        """
+        dts = np.diff(timestamps, prepend=self.ts) / 1000.0
+        np.maximum(dts, 0.0, out=dts)
+        T = float(dts.sum())
+        remaining = T - np.cumsum(dts)
+
+        # exact double integration of the piecewise constant accelerations
+        accelerations = accelerations - self.x[B]
+        self.x[D] += self.x[V] * T + np.dot(dts * (dts / 2 + remaining), accelerations)
+        self.x[V] += np.dot(dts, accelerations)
+
+        self.propagate_covariance(T)
+        self.ts = float(timestamps[-1])
+
+    def skip_to(self, ts: float):
+        # Propagates without accelerations, e.g. over a gap between two frame pairs
+        if self.ts is None:
+            self.ts = ts
+        elif ts > self.ts:
+            T = (ts - self.ts) / 1000.0
+            self.x[D] += self.x[V] * T
+            self.propagate_covariance(T)
+            self.ts = ts
+
+    def reset_displacement(self):
+        # The next interval starts at the current position, which is known exactly relative to itself
+        self.x[D] = 0.0
+        self.P[D, :] = 0.0
+        self.P[:, D] = 0.0
+
+    def update(self, direction: np.array, T: float) -> Optional[float]:
+        """
+        Measures that the displacement since the last reset points along direction.
+        :param direction: (3,) unit vector of the motion between the camera frames in the world frame
+        :param T: s between the camera frames
+        :return: the updated speed, or None if the measurement was rejected by the gate
+        """
+        H = self.H
+        H[:, S] = -T * direction
+        # the expected measurement d - s * T * u is zero
+        np.dot(H, self.x, out=self.innovation)
+        np.negative(self.innovation, out=self.innovation)
+
+        np.dot(self.P, H.T, out=self.PHt)
+        np.dot(H, self.PHt, out=self.innovation_cov)
+        self.innovation_cov += self.R
+
+        # K^T = S^-1 H P, S is symmetric
+        self.K[:] = np.linalg.solve(self.innovation_cov, self.PHt.T).T
+        if float(np.dot(self.innovation, np.linalg.solve(self.innovation_cov, self.innovation))) > self.gate:
+            return None
+
+        self.x += np.dot(self.K, self.innovation)
+
+        # Joseph form: P = (I - KH) P (I - KH)^T + K R K^T
+        np.dot(self.K, H, out=self.IKH)
+        np.negative(self.IKH, out=self.IKH)
+        self.IKH[np.arange(N_STATES), np.arange(N_STATES)] += 1.0
+        np.dot(self.IKH, self.P, out=self.FP)
+        np.dot(self.FP, self.IKH.T, out=self.P)
+        np.dot(self.K, self.R, out=self.KR)
+        self.P += np.dot(self.KR, self.K.T)
+        return self.speed
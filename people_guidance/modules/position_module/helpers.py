@@ -13,7 +13,7 @@ from math import atan2, sqrt, cos, sin
 from cmath import acos
 
 IMUFrame = collections.namedtuple("IMUFrame", ["ax", "ay", "az", "gx", "gy", "gz", "quaternion", "ts"])
-VOResult = collections.namedtuple("VOResult", ["homogs", "pairs", "ts0", "ts1", "image"])
+VOResult = collections.namedtuple("VOResult", ["homogs", "pairs", "ts0", "ts1", "frame_id", "intrinsic_matrix"])
 
 DEGREE_TO_RAD = float(pi / 180)
 
@@ -7,13 +7,17 @@ import numpy as np
 from scipy.spatial.transform import Rotation
 from math import tan, atan2, cos, sin, pi, sqrt, atan, acos
 
+from .config import *
 from ..module import Module
+from ...messages import FeaturePairs, HomographyData, IMUData, PositionData
 from .helpers import IMUFrame, VOResult, Homography, interpolate_frames
 from .helpers import visualize_input_data, visualize_distance_metric, pygameVisualize
 from .helpers import degree_to_rad, MovingAverageFilter, ComplementaryFilter, Velocity
 from .helpers import rotMat_to_anlgeAxis, quat_to_rotMat, rotMat_to_ypr, angleAxis_to_rotMat, quaternion_to_rotMat, \
     angleAxis_to_quaternion, quaternion_to_angleAxis, rotMat_to_quaternion, quaternion_apply, quat_to_ypr
 from .helpers import check_correct_rot_mat, normalise_rotation
+from .fusion import VisualInertialFilter, to_world
+from .selection import relative_rotation, select_pose
 
 
 class PositionModule(Module):
@@ -22,7 +26,10 @@ class PositionModule(Module):
                          outputs=[("homography", 1000), ("position_vis", 10)],
                          inputs=["drivers_module:accelerations",
                                  "feature_tracking_module:feature_point_pairs"],
-                         log_dir=log_dir)
+                         log_dir=log_dir,
+                         schemas={"homography": HomographyData, "position_vis": PositionData,
+                                  "drivers_module:accelerations": IMUData,
+                                  "feature_tracking_module:feature_point_pairs": FeaturePairs})
 
         self.vo_buffer: List[VOResult] = []
         self.imu_buffer: List[IMUFrame] = []
@@ -31,6 +38,7 @@ class PositionModule(Module):
         self.complementary_filter = ComplementaryFilter()
 
         self.velocity = Velocity()
+        self.fusion = VisualInertialFilter()
 
         self.vispg = pygameVisualize()
 
@@ -73,7 +81,7 @@ class PositionModule(Module):
     def vo_result_from_payload(payload: Dict):
         return VOResult(homogs=payload["data"]["camera_positions"], pairs=payload["data"]["point_pairs"],
                         ts0=payload["data"]["timestamp_pair"][0], ts1=payload["data"]["timestamp_pair"][1],
-                        image=payload["data"]["image"])
+                        frame_id=payload["data"]["frame_id"], intrinsic_matrix=payload["data"]["intrinsic_matrix"])
 
     def prune_buffers(self):
         if len(self.vo_buffer) > 1 and len(self.imu_buffer) > 1:
@@ -113,18 +121,24 @@ class PositionModule(Module):
                                  f"{vo_result.ts1} i1 {self.imu_buffer[i1].ts}")
 
                 frames: List[IMUFrame] = self.find_integration_frames(vo_result.ts0, vo_result.ts1, i0, i1)
-                imu_homography: Homography = self.integrate(frames)
-                # self.logger.info(f"IMU : {imu_homography.roll}, {imu_homography.pitch}, {imu_homography.yaw}")
-
-                homog: np.array = self.choose_nearest_homography(vo_result, imu_homography)
+                if USE_SCALE == 'fusion':
+                    fused = self.fuse(vo_result, frames)
+                    imu_homography = None
+                else:
+                    fused = False
+                    imu_homography: Homography = self.integrate(frames)
+                    # self.logger.info(f"IMU : {imu_homography.roll}, {imu_homography.pitch}, {imu_homography.yaw}")
+
+                homog, confidence = self.choose_nearest_homography(vo_result, imu_homography, frames, fused)
                 prune_idxs.append(idx)
 
-                self.publish("homography", {"homography": homog, "point_pairs": vo_result.pairs,
-                                            "timestamps": (vo_result.ts0, vo_result.ts1),
-                                            "image": vo_result.image}, -1)
+                self.publish("homography", HomographyData(homography=homog, point_pairs=vo_result.pairs,
+                                                          timestamps=(vo_result.ts0, vo_result.ts1),
+                                                          frame_id=vo_result.frame_id,
+                                                          intrinsic_matrix=vo_result.intrinsic_matrix,
+                                                          confidence=confidence), -1)
 
-                self.publish("position_vis", {"x": 0.0, "y": 0.0, "z": 0.0,
-                                              "roll": 0.0, "pitch": 0.0, "yaw": 0.}, 1000)
+                self.publish("position_vis", PositionData(x=0.0, y=0.0, z=0.0, roll=0.0, pitch=0.0, yaw=0.), 1000)
 
         for offset, idx in enumerate(prune_idxs):
             # we assume that the prune_idxs are sorted low to high
@@ -195,40 +209,63 @@ class PositionModule(Module):
         integration_frames.append(upper_frame_bound)
         return integration_frames
 
-    def choose_nearest_homography(self, vo_result: VOResult, imu_homog: Homography) -> np.array:
-        imu_homog_matrix = imu_homog.as_Tmatrix()
-        imu_rot = imu_homog_matrix[0:3, 0:3]
-        imu_t_vec = imu_homog_matrix[0:3, 3]
-
-        # Correction: Homography gives a result rotated from our camera coordinate frame.
-        vo_to_camera = np.array([[0, 0, -1], [1, 0, 0], [0, 1, 0]])
-
-        for homog in vo_result.homogs:
-            # Expressing the translation vector in the camera frame
-            vo_t_vec = vo_to_camera.dot(homog[0:3, 3])
-
-            # Expressing the rotation in the camera frame
-            # normalise the input frame as it happens that the rotation matrix has elements with value above 1
-            vo_homog = normalise_rotation(homog[0:3, 0:3])
-            vo_angle_axis = vo_to_camera.dot(rotMat_to_anlgeAxis(vo_homog))
-            vo_quat = angleAxis_to_quaternion(vo_angle_axis)
-
-            # Scale
-            USE_SCALE = 'relative'
+    def fuse(self, vo_result: VOResult, frames: List[IMUFrame]) -> bool:
+        # Integrates the IMU frames between the camera frames of vo_result into the fusion filter. Returns False if the
+        # pair starts before the last one ended, the filter can not go back in time.
+        if self.fusion.ts is not None and vo_result.ts0 < self.fusion.ts:
+            return False
+        self.fusion.skip_to(vo_result.ts0)
+        self.fusion.reset_displacement()
+
+        # frames[0] is interpolated at ts0, every frame is held over the interval which ends at its timestamp
+        accelerations = np.array([(frame.ax, frame.ay, frame.az) for frame in frames[1:]])
+        quaternions = np.array([frame.quaternion for frame in frames[1:]])
+        timestamps = np.array([frame.ts for frame in frames[1:]], dtype=np.float64)
+        self.fusion.propagate(to_world(accelerations, quaternions), timestamps)
+        return True
+
+    def get_fused_scale(self, vo_result: VOResult, homog: np.array, frames: List[IMUFrame]) -> Optional[float]:
+        # The camera of the second frame is at -R^T t in the OpenCV axes of the first camera frame, the IMU frames use
+        # the axes of our camera frame
+        motion = VO_TO_CAMERA.dot(-np.dot(homog[0:3, 0:3].T, homog[0:3, 3]))
+        length = np.linalg.norm(motion)
+        if length == 0:
+            return None
+        direction = to_world((motion / length).reshape(1, 3), np.asarray(frames[0].quaternion).reshape(1, 4))[0]
+
+        T = (vo_result.ts1 - vo_result.ts0) / 1000.0
+        speed = self.fusion.update(direction, T)
+        if speed is None:
+            self.logger.debug(f"Fusion rejected the translation of the pair {vo_result.ts0}, {vo_result.ts1}")
+            return None
+        # standing still, a translation of length zero can not be triangulated
+        return speed * T / length if speed > 0 else None
+
+    def choose_nearest_homography(self, vo_result: VOResult, imu_homog: Optional[Homography],
+                                  frames: List[IMUFrame], fused: bool = False) -> Tuple[np.array, float]:
+        # Returns the candidate of the visual odometry which agrees best with the IMU rotation and the matches, with
+        # its translation scaled, and the confidence of the choice
+        imu_rotation = relative_rotation(frames[0].quaternion, frames[-1].quaternion)
+        idx, confidence = select_pose(vo_result.homogs, vo_result.pairs[:, :2], vo_result.pairs[:, 2:],
+                                      vo_result.intrinsic_matrix, imu_rotation)
+        homog = np.asarray(vo_result.homogs[idx], dtype=np.float64)
+        self.logger.debug(f"Chose candidate {idx} of {len(vo_result.homogs)} with confidence {confidence:.2f}")
+
+        # Scale, the relative scale is the fallback of the fusion
+        scale = self.get_fused_scale(vo_result, homog, frames) if fused else None
+        if scale is None:
+            # Correction: Homography gives a result rotated from our camera coordinate frame.
+            vo_t_vec = VO_TO_CAMERA.dot(homog[0:3, 3])
             if USE_SCALE == 'absolute':
-                scale = self.get_absolute_scale(imu_t_vec, vo_t_vec)
-            elif USE_SCALE == 'relative':
+                scale = self.get_absolute_scale(imu_homog.as_Tmatrix()[0:3, 3], vo_t_vec)
+            elif USE_SCALE in ('relative', 'fusion'):
                 scale = self.get_relative_scale(vo_t_vec)
             elif USE_SCALE == 'groundtruth':
                 scale = self.get_groundtruth_scale()
             elif USE_SCALE == 'approx':
-                scale = self.get_approx_scale(imu_t_vec, vo_t_vec)
+                scale = self.get_approx_scale(imu_homog.as_Tmatrix()[0:3, 3], vo_t_vec)
 
-            #ret_homog = np.column_stack((quaternion_to_rotMat(vo_quat), scale*vo_t_vec))
-            vo_tran = homog[0:3, 3]
-            vo_rot = homog[0:3, 0:3]
-            ret_homog = np.hstack((vo_rot, scale*vo_tran.reshape(3,1)))
-            return ret_homog
+        return np.hstack((homog[0:3, 0:3], scale * homog[0:3, 3:4])), confidence
 
     def get_absolute_scale(self, imu_t_vec, vo_t_vec):
         # LS fit
@@ -0,0 +1,74 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .config import *
+from .fusion import quaternions_to_matrices
+
+
+def relative_rotation(quaternion0, quaternion1) -> np.array:
+    # Rotation of the camera coordinates from the first to the second frame, x1 = R x0 like the [R|t] of OpenCV.
+    # The IMU frames use the axes of our camera frame, VO_TO_CAMERA maps the OpenCV axes onto them: R = V^T R_imu V.
+    matrices = quaternions_to_matrices(np.array([quaternion0, quaternion1]))
+    return np.linalg.multi_dot((VO_TO_CAMERA.T, matrices[1], matrices[0].T, VO_TO_CAMERA))
+
+
+def rotation_distances(rotations: np.array, reference: np.array) -> np.array:
+    # (k, 3, 3) -> (k,) angles in radians of R_k^T reference, trace(A^T B) is the sum of A * B
+    traces = np.einsum("kij,ij->k", rotations, reference)
+    return np.arccos(np.clip((traces - 1.0) / 2.0, -1.0, 1.0))
+
+
+def cheirality(candidates: np.array, points0: np.array, points1: np.array, intrinsic_matrix: np.array,
+               max_points: int = POSE_MAX_POINTS) -> np.array:
+    """
+    Fraction of the matches which lie in front of both cameras for every candidate [R|t].
+
+    The depths of the two rays x1 * l1 = R x0 * l0 + t are the closed-form least squares solution of a 2x2 system,
+    computed for all candidates and matches at once. Only the signs are used, so the scale of t does not matter.
+    :param candidates: (k, 3, 4)
+    :param points0, points1: (N, 2) pixels in the resolution of intrinsic_matrix
+    :return: (k,) fractions, zero if there are no matches
+    """
+    if points0.shape[0] == 0:
+        return np.zeros(candidates.shape[0])
+    step = max(1, -(-points0.shape[0] // max_points))
+    inverse_intrinsic = np.linalg.inv(intrinsic_matrix)
+    x0 = np.dot(points0[::step], inverse_intrinsic[:, :2].T) + inverse_intrinsic[:, 2]
+    x1 = np.dot(points1[::step], inverse_intrinsic[:, :2].T) + inverse_intrinsic[:, 2]
+
+    a = np.einsum("kij,nj->kni", candidates[:, :, :3], x0)  # (k, n, 3) rays of the first camera in the second one
+    t = candidates[:, None, :, 3]
+    aa = np.einsum("kni,kni->kn", a, a)
+    ab = np.einsum("kni,ni->kn", a, x1)
+    at = np.einsum("kni,kni->kn", a, np.broadcast_to(t, a.shape))
+    bb = np.einsum("ni,ni->n", x1, x1)
+    bt = np.einsum("ni,kni->kn", x1, np.broadcast_to(t, a.shape))
+
+    # [aa -ab; -ab bb] [l0 l1]^T = [-at bt]^T, the determinant is positive unless the rays are parallel
+    det = aa * bb - ab * ab
+    depth0 = ab * bt - at * bb
+    depth1 = aa * bt - ab * at
+    in_front = (depth0 * det > 0) & (depth1 * det > 0)
+    return in_front.mean(axis=1)
+
+
+def select_pose(candidates: np.array, points0: np.array, points1: np.array, intrinsic_matrix: np.array,
+                imu_rotation: Optional[np.array] = None) -> Tuple[int, float]:
+    """
+    Chooses the candidate [R|t] of the visual odometry which puts the most matches in front of both cameras and
+    whose rotation agrees with the IMU, weighted with a gaussian of width POSE_ROTATION_SIGMA.
+    :return: the index of the best candidate and a confidence in [0, 1], its score minus the score of the runner-up
+    """
+    candidates = np.asarray(candidates, dtype=np.float64).reshape(-1, 3, 4)
+    scores = cheirality(candidates, np.asarray(points0, dtype=np.float64), np.asarray(points1, dtype=np.float64),
+                        intrinsic_matrix)
+    if imu_rotation is not None:
+        distances = rotation_distances(candidates[:, :, :3], imu_rotation)
+        scores *= np.exp(-0.5 * (distances / POSE_ROTATION_SIGMA) ** 2)
+
+    best = int(np.argmax(scores))
+    if scores.shape[0] == 1:
+        return best, float(scores[best])
+    runner_up = np.partition(scores, -2)[-2]
+    return best, float(scores[best] - runner_up)
@@ -0,0 +1,2 @@
+from .recorder_module import RecorderModule
+from .store import RecordWriter, RecordReader
@@ -0,0 +1,10 @@
+DEFAULT_CHANNELS = ("position_module:homography", "reprojection_module:points3d", "reprojection_module:criticality")
+
+CHUNK_MESSAGES = 100  # a chunk of a channel is written once it holds this many messages
+CHUNK_SECONDS = 10.0  # or once its oldest message is older than this
+WRITER_QUEUE_SIZE = 1000  # messages waiting for the writer thread, new messages are dropped if it is full
+# s to drain the queue and write the last chunks on shutdown, the pipeline kills its children after 2 s
+WRITER_CLOSE_TIMEOUT = 1.5
+
+# Images are already recorded by the drivers module and would dominate the size of the record
+EXCLUDED_KEYS = ("image", "img")
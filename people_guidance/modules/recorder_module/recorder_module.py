@@ -0,0 +1,72 @@
+import pathlib
+import queue
+import threading
+from time import sleep
+from typing import Optional
+
+from ..module import Module
+from .config import *
+from .store import RecordWriter
+
+
+class RecorderModule(Module):
+    """
+    Records the messages of arbitrary channels for offline analysis, see RecordReader to read them. The channels are
+    tapped, so the recorder does not take messages away from the modules which consume them.
+    """
+    def __init__(self, log_dir: pathlib.Path, args=None):
+        channels = DEFAULT_CHANNELS
+        if args is not None and args.record_channels:
+            channels = args.record_channels.split(",")
+        super(RecorderModule, self).__init__(name="recorder_module", taps=channels, log_dir=log_dir)
+
+        self.record_dir = pathlib.Path(args.record_outputs) if args is not None and args.record_outputs \
+            else log_dir / "record"
+
+        self.writer_thread: Optional[threading.Thread] = None
+        self.stop_writer = threading.Event()
+
+    def start(self):
+        # Compression and file access happen on the writer thread, the main loop only drains the taps
+        messages = queue.Queue(maxsize=WRITER_QUEUE_SIZE)
+        self.writer_thread = threading.Thread(target=self.writer_main, args=(messages,), daemon=True)
+        self.writer_thread.start()
+        self.logger.info(f"Recording {self.taps} to {self.record_dir}")
+
+        dropped = 0
+        while True:
+            received = False
+            for channel in self.taps:
+                payload = self.get(channel)
+                if payload:
+                    received = True
+                    try:
+                        messages.put_nowait((channel, payload["timestamp"], payload["data"]))
+                    except queue.Full:
+                        dropped += 1
+                        if dropped % 100 == 1:
+                            self.logger.warning(f"The writer can not keep up, dropped {dropped} messages so far.")
+            if not received:
+                sleep(0.001)
+
+    def writer_main(self, messages: queue.Queue):
+        writer = RecordWriter(self.record_dir)
+        try:
+            # After a stop the queue is drained before the writer is closed
+            while not self.stop_writer.is_set() or not messages.empty():
+                try:
+                    channel, timestamp, data = messages.get(timeout=0.1)
+                    writer.append(channel, timestamp, data)
+                except queue.Empty:
+                    pass
+                writer.flush_expired()
+        finally:
+            # writes the partially filled chunks of all channels
+            writer.close()
+
+    def cleanup(self):
+        if self.writer_thread is not None:
+            self.stop_writer.set()
+            self.writer_thread.join(timeout=WRITER_CLOSE_TIMEOUT)
+            if self.writer_thread.is_alive():
+                self.logger.warning("The writer did not finish in time, the end of the record may be missing.")
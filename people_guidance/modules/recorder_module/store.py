@@ -0,0 +1,186 @@
+import os
+import pathlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .config import *
+from ...messages import Message
+
+# One entry per message, appended once the chunk holding the message was written
+INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("channel", "<u2"), ("chunk", "<u4"), ("message", "<u4")])
+
+
+def flatten(value: Any, path: str, out: Dict[str, np.array]):
+    # Stores nested dicts, tuples and lists of arrays and scalars as flat arrays keyed by their path.
+    # Typed messages are stored like the dicts they replace.
+    if isinstance(value, Message):
+        value = value.as_dict()
+    if isinstance(value, dict):
+        if not value:
+            out[f"{path}/!dict"] = np.zeros(0)
+        for key, item in value.items():
+            if key not in EXCLUDED_KEYS:
+                flatten(item, f"{path}/{key}", out)
+    elif isinstance(value, (tuple, list)):
+        if not value:
+            out[f"{path}/!tuple"] = np.zeros(0)
+        for i, item in enumerate(value):
+            flatten(item, f"{path}/#{i}", out)
+    elif value is None:
+        out[f"{path}/!none"] = np.zeros(0)
+    else:
+        out[path] = np.asarray(value)
+
+
+def unflatten(arrays: Dict[str, np.array]) -> Any:
+    root: Dict = {}
+    for path, array in arrays.items():
+        *parents, name = path.split("/")
+        node = root
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[name] = array.item() if array.ndim == 0 else array
+    return restore(root)
+
+
+def restore(node: Any) -> Any:
+    if not isinstance(node, dict):
+        return node
+    if "!none" in node:
+        return None
+    if "!dict" in node:
+        return {}
+    if "!tuple" in node:
+        return ()
+    if node and all(key.startswith("#") for key in node):
+        return tuple(restore(node[f"#{i}"]) for i in range(len(node)))
+    return {key: restore(item) for key, item in node.items()}
+
+
+class RecordWriter:
+    """
+    Append only store of the messages of several channels. The messages of each channel are buffered and written as
+    compressed chunks (one .npz file per chunk). The index file only grows and is updated after a chunk was written
+    completely, so a record that was interrupted is still readable up to the last chunk.
+    """
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        channels_file = self.path / "channels.txt"
+        self.channels: List[str] = channels_file.read_text().split() if channels_file.exists() else []
+        self.chunk_counter = len([chunk for chunk in self.path.glob("chunk_*.npz") if ".tmp" not in chunk.suffixes])
+        self.index_file = open(self.path / "index.bin", "ab")
+
+        self.buffers: Dict[str, List[Tuple[float, Dict[str, np.array]]]] = {}
+        self.buffer_started: Dict[str, float] = {}
+
+    def append(self, channel: str, timestamp: float, data: Any):
+        if channel not in self.channels:
+            self.channels.append(channel)
+            with open(self.path / "channels.txt", "a") as channels_file:
+                channels_file.write(f"{channel}\n")
+
+        arrays: Dict[str, np.array] = {}
+        flatten(data, "data", arrays)
+        if channel not in self.buffers or not self.buffers[channel]:
+            self.buffers[channel] = []
+            self.buffer_started[channel] = time.monotonic()
+        self.buffers[channel].append((timestamp, arrays))
+
+        if len(self.buffers[channel]) >= CHUNK_MESSAGES:
+            self.flush(channel)
+
+    def flush_expired(self):
+        for channel, started in self.buffer_started.items():
+            if self.buffers[channel] and time.monotonic() - started > CHUNK_SECONDS:
+                self.flush(channel)
+
+    def flush(self, channel: str):
+        messages = self.buffers[channel]
+        if not messages:
+            return
+        self.buffers[channel] = []
+
+        chunk = self.chunk_counter
+        self.chunk_counter += 1
+        arrays = {f"{i}/{key}": array for i, (_, message) in enumerate(messages) for key, array in message.items()}
+
+        # Written to a temporary file first, the chunk only appears once it is complete
+        chunk_path = self.path / f"chunk_{chunk:06d}.npz"
+        temporary_path = self.path / f"chunk_{chunk:06d}.tmp.npz"
+        np.savez_compressed(temporary_path, **arrays)
+        os.replace(temporary_path, chunk_path)
+
+        index = np.empty(len(messages), dtype=INDEX_DTYPE)
+        index["timestamp"] = [timestamp for timestamp, _ in messages]
+        index["channel"] = self.channels.index(channel)
+        index["chunk"] = chunk
+        index["message"] = np.arange(len(messages))
+        self.index_file.write(index.tobytes())
+        self.index_file.flush()
+
+    def close(self):
+        for channel in list(self.buffers):
+            self.flush(channel)
+        self.index_file.close()
+
+
+class RecordReader:
+    """
+    Random access to a record written by RecordWriter. Only the index is memory mapped on opening, the chunks are
+    loaded on demand and the most recently used ones are cached.
+    """
+    def __init__(self, path: pathlib.Path, cached_chunks: int = 4):
+        self.path = pathlib.Path(path)
+        self.channels: List[str] = (self.path / "channels.txt").read_text().split()
+
+        index_path = self.path / "index.bin"
+        if index_path.stat().st_size > 0:
+            self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r")
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+
+        # Index entries of every channel sorted by timestamp
+        self.entries: Dict[str, np.array] = {}
+        for channel_id, channel in enumerate(self.channels):
+            entries = np.asarray(self.index[self.index["channel"] == channel_id])
+            self.entries[channel] = entries[np.argsort(entries["timestamp"], kind="stable")]
+
+        self.cached_chunks = cached_chunks
+        self.chunks: OrderedDict = OrderedDict()
+
+    def timestamps(self, channel: str) -> np.array:
+        return self.entries[channel]["timestamp"]
+
+    def read(self, channel: str, timestamp: float) -> Optional[Tuple[float, Any]]:
+        # Returns the latest message of the channel at or before the timestamp
+        entries = self.entries[channel]
+        position = np.searchsorted(entries["timestamp"], timestamp, side="right") - 1
+        if position < 0:
+            return None
+        return self.load(entries[position])
+
+    def iterate(self, channel: str, start: float = -np.inf, end: float = np.inf) -> Iterator[Tuple[float, Any]]:
+        entries = self.entries[channel]
+        first, last = np.searchsorted(entries["timestamp"], (start, end), side="left")
+        for entry in entries[first:last]:
+            yield self.load(entry)
+
+    def load(self, entry) -> Tuple[float, Any]:
+        chunk = self.chunk(int(entry["chunk"]))
+        prefix = f"{int(entry['message'])}/"
+        arrays = {key[len(prefix):]: chunk[key] for key in chunk.files if key.startswith(prefix)}
+        return float(entry["timestamp"]), unflatten(arrays)["data"]
+
+    def chunk(self, chunk: int):
+        if chunk in self.chunks:
+            self.chunks.move_to_end(chunk)
+        else:
+            self.chunks[chunk] = np.load(self.path / f"chunk_{chunk:06d}.npz")
+            if len(self.chunks) > self.cached_chunks:
+                self.chunks.popitem(last=False)[1].close()
+        return self.chunks[chunk]
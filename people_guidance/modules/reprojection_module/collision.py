@@ -0,0 +1,75 @@
+from math import ceil, floor, tan
+from typing import Dict, Tuple
+
+import numpy as np
+
+from .config import *
+
+
+class CollisionGrid:
+    """
+    Grid index over the ground plane (x forward, y left) of the guidance frame. The points are sorted by cell once per
+    cloud, the cells of one forward row are contiguous, so a corridor query only touches the points of the cells it
+    overlaps instead of the whole cloud. Points outside of COLLISION_GRID_EXTENT are never relevant and are dropped.
+    """
+    def __init__(self, cell_size: float = COLLISION_GRID_CELL, extent: Tuple[float, float] = COLLISION_GRID_EXTENT):
+        self.cell_size = cell_size
+        self.half_width = extent[1]
+        self.n_rows = int(ceil(extent[0] / cell_size))
+        self.n_columns = int(ceil(2 * extent[1] / cell_size))
+
+        self.points = np.zeros((0, 3), dtype=np.float32)
+        self.offsets = np.zeros(self.n_rows * self.n_columns + 1, dtype=np.int64)
+
+    def build(self, points: np.array):
+        rows = np.floor(points[:, 0] / self.cell_size).astype(np.int64)
+        columns = np.floor((points[:, 1] + self.half_width) / self.cell_size).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.n_rows) & (columns >= 0) & (columns < self.n_columns)
+
+        cells = rows[inside] * self.n_columns + columns[inside]
+        order = np.argsort(cells, kind="stable")
+        self.points = points[inside][order]
+        self.offsets = np.searchsorted(cells[order], np.arange(self.n_rows * self.n_columns + 1))
+
+    def corridor(self, length: float = CORRIDOR_LENGTH, radius: float = CORRIDOR_RADIUS,
+                 shape: str = CORRIDOR_SHAPE, zone: Tuple[float, float] = None) -> np.array:
+        """
+        :return: the points within length along the walking direction whose lateral offset is within the radius of
+            the corridor and whose height is inside the zone (all heights if zone is None)
+        """
+        slope = tan(CORRIDOR_CONE_ANGLE) if shape == 'CONE' else 0.0
+
+        candidates = []
+        for row in range(min(int(ceil(length / self.cell_size)), self.n_rows)):
+            # the corridor is widest at the far edge of the row
+            row_radius = radius + slope * (row + 1) * self.cell_size
+            first = max(int(floor((self.half_width - row_radius) / self.cell_size)), 0)
+            last = min(int(floor((self.half_width + row_radius) / self.cell_size)), self.n_columns - 1)
+            start, end = self.offsets[row * self.n_columns + first], self.offsets[row * self.n_columns + last + 1]
+            if end > start:
+                candidates.append(self.points[start:end])
+
+        if not candidates:
+            return np.zeros((0, 3), dtype=self.points.dtype)
+        candidates = np.concatenate(candidates)
+
+        inside = (candidates[:, 0] <= length) & (np.abs(candidates[:, 1]) <= radius + slope * candidates[:, 0])
+        if zone is not None:
+            inside &= (candidates[:, 2] >= zone[0]) & (candidates[:, 2] < zone[1])
+        return candidates[inside]
+
+
+def query_zones(grid: CollisionGrid, speed: float, zones: Dict = COLLISION_ZONES) -> Dict[str, Dict[str, float]]:
+    """
+    Queries the corridor for every height zone.
+    :param speed: current walking speed in m/s, used for the time to contact
+    :return: per zone the number of points in the corridor, the distance to the closest one in m and the time until
+        the user reaches it in s. Distance and time to contact are inf for an empty zone.
+    """
+    results = {}
+    for name, band in zones.items():
+        points = grid.corridor(zone=band)
+        distance = float(points[:, 0].min()) if points.shape[0] > 0 else float("inf")
+        time_to_contact = distance / speed if speed > 1e-6 else float("inf")
+        results[name] = {"n_points": int(points.shape[0]), "distance": distance, "time_to_contact": time_to_contact}
+    return results
@@ -0,0 +1,50 @@
+import numpy as np
+
+# Changes from the camera frame (x right, y down, z forward) to the guidance frame (x forward, y left, z up)
+CAMERA_TO_GUIDANCE = np.array([[0., 0., 1.],
+                               [-1., 0., 0.],
+                               [0., -1., 0.]], dtype=np.float32)
+
+# Can be either MIDPOINT (closed form) or DLT (batched SVD, same as cv2.triangulatePoints)
+TRIANGULATION_METHOD = 'MIDPOINT'
+
+# Triangulated points are only kept if they lie in front of both cameras and reproject onto both of their image
+# points within this distance in pixels
+MAX_REPROJECTION_ERROR = 4.0
+
+# The points of consecutive frames are accumulated in a local map which is stored as a voxel hash
+USE_LOCAL_MAP = True
+MAP_VOXEL_SIZE = 0.1  # m, points within one voxel are merged into their centroid
+MAP_MEMORY_BUDGET = 4 * 1024 ** 2  # bytes, fixes the maximum number of voxels. The oldest voxels are evicted first
+MAP_MAX_AGE = 3000  # ms since a voxel was last observed
+MAP_MAX_DISTANCE = 15.0  # m from the current camera position
+MAP_MAX_POSES = 50  # number of recent camera poses kept to chain the homographies of overlapping frame pairs
+
+# Collision queries run against the points in a corridor along the walking direction (x axis of the guidance frame)
+CORRIDOR_SHAPE = 'CYLINDER'  # Can be either CYLINDER (constant radius) or CONE (radius grows with the distance)
+CORRIDOR_RADIUS = 0.5  # m, lateral half width of the corridor at the user
+CORRIDOR_CONE_ANGLE = 0.1  # rad, half opening angle of the CONE corridor
+CORRIDOR_LENGTH = 5.0  # m
+# Height bands relative to the camera (z up) in m. The ground band starts above the floor at a camera height of 1.3m
+COLLISION_ZONES = {'GROUND': (-1.15, -0.8), 'WAIST': (-0.8, -0.2), 'HEAD': (-0.2, 0.5)}
+COLLISION_GRID_CELL = 0.25  # m, cell size of the grid index
+COLLISION_GRID_EXTENT = (10.0, 3.0)  # m, (forward, lateral half width) covered by the grid index
+
+# Egocentric 2.5D occupancy grid in the guidance frame, the user is at the bottom center of the grid
+OCCUPANCY_CELL = 0.1  # m
+OCCUPANCY_EXTENT = (8.0, 3.0)  # m, (forward, lateral half width)
+OCCUPANCY_DECAY = 0.85  # factor applied to the occupancy of every cell per update
+OCCUPANCY_HIT = 0.25  # occupancy added per point in a cell
+OCCUPANCY_THRESHOLD = 0.1  # the height of cells below this occupancy is cleared
+OCCUPANCY_FLOOR = -1.3  # m, height of the floor relative to the camera
+OCCUPANCY_HEIGHT_RANGE = (-1.15, 0.5)  # m relative to the camera, points outside of it are not obstacles
+OCCUPANCY_HEIGHT_RESOLUTION = 0.01  # m per step of the published uint8 height above the floor
+
+# Constant velocity Kalman filter over the published criticality
+CRITICALITY_PROCESS_NOISE = 2.0  # variance of the change of the criticality rate in 1/s^4
+CRITICALITY_MEASUREMENT_NOISE = 0.02  # variance of a measurement with zero uncertainty
+UNCERTAINTY_SMOOTHING = 0.1  # weight of a new observation in the expected number of points and update interval
+
+# Subscribers of points3d can declare a budget of points, they get a decimated copy of the cloud
+DECIMATION_METHOD = 'VOXEL'  # Can be either RANDOM, VOXEL or FARTHEST_POINT
+DECIMATION_VOXEL_SIZE = 0.05  # m, initial voxel size of VOXEL. It is doubled until the cloud fits into the budget
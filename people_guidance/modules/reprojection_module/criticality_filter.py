@@ -0,0 +1,49 @@
+from .config import *
+
+
+class CriticalityFilter:
+    """
+    Kalman filter over the criticality and its rate of change (constant velocity model). Measurements are weighted by
+    their uncertainty, a measurement with uncertainty 1 is almost ignored. The 2x2 covariance is kept in three
+    scalars, so an update does not allocate.
+    """
+    def __init__(self, process_noise: float = CRITICALITY_PROCESS_NOISE,
+                 measurement_noise: float = CRITICALITY_MEASUREMENT_NOISE):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+
+        self.criticality = 0.0
+        self.rate = 0.0  # 1/s
+        self.p00, self.p01, self.p11 = 1.0, 0.0, 1.0
+        self.timestamp = None
+
+    def __call__(self, measurement: float, timestamp: float, uncertainty: float = 0.0) -> float:
+        """
+        :param timestamp: ms
+        :return: the filtered criticality in [0, 1]
+        """
+        if self.timestamp is None:
+            self.criticality = measurement
+            self.timestamp = timestamp
+            return min(max(self.criticality, 0.0), 1.0)
+
+        dt = max(timestamp - self.timestamp, 0.0) / 1000
+        self.timestamp = timestamp
+
+        # Prediction with a white noise change of the rate
+        criticality = self.criticality + dt * self.rate
+        q = self.process_noise
+        p00 = self.p00 + dt * (2 * self.p01 + dt * self.p11) + q * dt ** 4 / 4
+        p01 = self.p01 + dt * self.p11 + q * dt ** 3 / 2
+        p11 = self.p11 + q * dt ** 2
+
+        # Correction
+        r = self.measurement_noise / max(1.0 - uncertainty, 0.01)
+        k0, k1 = p00 / (p00 + r), p01 / (p00 + r)
+        innovation = measurement - criticality
+
+        self.criticality = criticality + k0 * innovation
+        self.rate += k1 * innovation
+        self.p00, self.p01, self.p11 = (1 - k0) * p00, (1 - k0) * p01, p11 - k1 * p01
+
+        return min(max(self.criticality, 0.0), 1.0)
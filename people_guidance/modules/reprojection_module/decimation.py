@@ -0,0 +1,55 @@
+import numpy as np
+
+from .config import *
+
+rng = np.random.default_rng()
+
+
+def decimate(points: np.array, budget: int, method: str = DECIMATION_METHOD) -> np.array:
+    """
+    Reduces an (N, 3) cloud to at most budget points.
+    RANDOM: uniform sample without replacement.
+    VOXEL: one point per voxel, the voxels grow until the budget is met. Keeps the spatial coverage of the cloud.
+    FARTHEST_POINT: greedily adds the point farthest from all selected ones. Best coverage but O(N * budget), only
+        suited for small budgets.
+    """
+    if points.shape[0] <= budget:
+        return points
+    if budget <= 0:
+        return points[:0]
+
+    if method == 'RANDOM':
+        return points[np.sort(rng.choice(points.shape[0], budget, replace=False))]
+    elif method == 'VOXEL':
+        return voxel_decimation(points, budget)
+    elif method == 'FARTHEST_POINT':
+        return farthest_point_decimation(points, budget)
+    raise ValueError(f"Unknown decimation method {method}")
+
+
+def voxel_decimation(points: np.array, budget: int, voxel_size: float = DECIMATION_VOXEL_SIZE) -> np.array:
+    origin = points.min(axis=0)
+    # Half the edge of a voxel grid over the bounding box with budget cells, a cloud fills only a part of the box
+    volume = float(np.prod(np.maximum(points.max(axis=0) - origin, voxel_size)))
+    voxel_size = max(voxel_size, 0.5 * (volume / budget) ** (1 / 3))
+    while True:
+        voxels = np.floor((points - origin) / voxel_size).astype(np.int64)
+        # Pack the voxel coordinates into one key, a 1D unique is much faster than a row wise one
+        dims = voxels.max(axis=0) + 1
+        keys = (voxels[:, 0] * dims[1] + voxels[:, 1]) * dims[2] + voxels[:, 2]
+        _, first = np.unique(keys, return_index=True)
+        if first.shape[0] <= budget:
+            return points[np.sort(first)]
+        # doubles the voxel volume
+        voxel_size *= 1.26
+
+
+def farthest_point_decimation(points: np.array, budget: int) -> np.array:
+    selected = np.empty(budget, dtype=np.int64)
+    selected[0] = 0
+    distances = np.full(points.shape[0], np.inf, dtype=np.float32)
+    for i in range(1, budget):
+        offsets = points - points[selected[i - 1]]
+        np.minimum(distances, np.einsum("ij,ij->i", offsets, offsets), out=distances)
+        selected[i] = np.argmax(distances)
+    return points[selected]
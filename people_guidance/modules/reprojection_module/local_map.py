@@ -0,0 +1,185 @@
+from collections import OrderedDict
+from itertools import repeat
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .config import *
+
+# 21 bits per voxel coordinate are packed into one int64 key
+KEY_BITS = 21
+KEY_OFFSET = 1 << (KEY_BITS - 1)
+# approximate size of an entry of the key -> slot dict, including the int objects of its key and value
+DICT_BYTES_PER_VOXEL = 100
+
+
+class LocalMap:
+    """
+    Rolling map of the triangulated points around the user. Points are chained into the frame of the first camera
+    (the map frame) using the homographies between the frame pairs and stored in a voxel hash: every voxel keeps the
+    sum of its points, so repeated observations of an obstacle are merged into one centroid.
+
+    All voxel data lives in preallocated arrays whose size is derived from MAP_MEMORY_BUDGET. Voxels are evicted if
+    they were not observed for MAP_MAX_AGE, are further than MAP_MAX_DISTANCE from the camera or, if the map is
+    full, in the order they were last observed.
+    """
+    def __init__(self, voxel_size: float = MAP_VOXEL_SIZE, memory_budget: int = MAP_MEMORY_BUDGET):
+        self.voxel_size = voxel_size
+
+        bytes_per_voxel = np.dtype(np.int64).itemsize + 3 * np.dtype(np.float64).itemsize + \
+            np.dtype(np.int32).itemsize + np.dtype(np.float64).itemsize + 2 * np.dtype(np.int64).itemsize + \
+            DICT_BYTES_PER_VOXEL
+        self.capacity = memory_budget // bytes_per_voxel
+
+        self.keys = np.full(self.capacity, -1, dtype=np.int64)  # -1 marks a free slot
+        self.sums = np.zeros((self.capacity, 3), dtype=np.float64)
+        self.counts = np.zeros(self.capacity, dtype=np.int32)
+        self.last_seen = np.zeros(self.capacity, dtype=np.float64)
+
+        # key -> slot of every voxel in the map. The occupied slots are kept in a dense list, so evicting and querying
+        # only touch the voxels in the map and not the whole capacity. Free slots are taken from a stack.
+        self.slot_of: Dict[int, int] = {}
+        self.occupied = np.empty(self.capacity, dtype=np.int64)
+        self.n_occupied = 0
+        self.free_slots = np.arange(self.capacity, dtype=np.int64)[::-1].copy()
+        self.n_free = self.capacity
+
+        # camera to map transformation of the most recent frames by timestamp
+        self.poses: OrderedDict = OrderedDict()
+        self.current_pose: Optional[np.array] = None
+
+    def __len__(self):
+        return self.n_occupied
+
+    def reset(self):
+        self.keys[:] = -1
+        self.counts[:] = 0
+        self.sums[:] = 0.0
+        self.slot_of.clear()
+        self.n_occupied = 0
+        self.free_slots[:] = np.arange(self.capacity, dtype=np.int64)[::-1]
+        self.n_free = self.capacity
+        self.poses.clear()
+        self.current_pose = None
+
+    def update_pose(self, homography: np.array, timestamps) -> np.array:
+        """
+        Chains the homography [R|t] from the camera at timestamps[0] to the camera at timestamps[1].
+        :return: the camera to map transformation of the first camera of the pair
+        """
+        if timestamps[0] not in self.poses:
+            if self.poses:
+                # The pair does not overlap with the known frames, the map can not be aligned with it anymore
+                self.reset()
+            self.poses[timestamps[0]] = np.eye(4)
+
+        transformation = np.eye(4)
+        transformation[:3] = homography
+        # X_1 = R X_0 + t, hence the pose of camera 1 in the map is T_0 inv([R|t])
+        pose = self.poses[timestamps[0]]
+        self.current_pose = np.dot(pose, np.linalg.inv(transformation))
+        self.poses[timestamps[1]] = self.current_pose
+
+        while len(self.poses) > MAP_MAX_POSES:
+            self.poses.popitem(last=False)
+        return pose
+
+    def insert(self, points: np.array, pose: np.array, timestamp: float):
+        """
+        :param points: (N, 3) points in the camera frame of pose
+        :param pose: camera to map transformation as returned by update_pose
+        :param timestamp: time at which the points were observed
+        """
+        points_map = np.dot(points, pose[:3, :3].T) + pose[:3, 3]
+        keys, in_range = self.voxel_keys(points_map)
+        keys, points_map = keys[in_range], points_map[in_range]
+
+        # Merge the new points per voxel before they are added to the map
+        voxel_keys, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.ravel()
+        counts = np.bincount(inverse, minlength=voxel_keys.shape[0])
+        sums = np.column_stack([np.bincount(inverse, weights=points_map[:, i], minlength=voxel_keys.shape[0])
+                                for i in range(3)])
+
+        slots = self.find(voxel_keys)
+        self.last_seen[slots[slots >= 0]] = timestamp
+
+        new = np.flatnonzero(slots < 0)
+        if new.shape[0] > 0:
+            # The voxels which were observed right now are never evicted to make room for the new ones
+            allocated = self.allocate(new.shape[0], protected=slots[slots >= 0])
+            new = new[:allocated.shape[0]]
+            slots[new] = allocated
+            self.keys[allocated] = voxel_keys[new]
+            self.last_seen[allocated] = timestamp
+            self.slot_of.update(zip(voxel_keys[new].tolist(), allocated.tolist()))
+            self.occupied[self.n_occupied:self.n_occupied + allocated.shape[0]] = allocated
+            self.n_occupied += allocated.shape[0]
+
+        # New voxels which did not fit into the map are dropped
+        inserted = slots >= 0
+        self.sums[slots[inserted]] += sums[inserted]
+        self.counts[slots[inserted]] += counts[inserted].astype(np.int32)
+
+    def evict(self, timestamp: float):
+        occupied = self.occupied[:self.n_occupied]
+        stale = timestamp - self.last_seen[occupied] > MAP_MAX_AGE
+
+        if self.current_pose is not None:
+            offsets = self.centroids(occupied) - self.current_pose[:3, 3]
+            stale |= np.einsum("ij,ij->i", offsets, offsets) > MAP_MAX_DISTANCE ** 2
+
+        self.free(occupied[stale])
+
+    def query(self) -> np.array:
+        # Returns the (N, 3) float32 centroids of all voxels in the frame of the current camera
+        centroids = self.centroids(self.occupied[:self.n_occupied])
+        if self.current_pose is None:
+            return centroids.astype(np.float32)
+        map_to_camera = np.linalg.inv(self.current_pose)
+        return (np.dot(centroids, map_to_camera[:3, :3].T) + map_to_camera[:3, 3]).astype(np.float32)
+
+    def centroids(self, slots: np.array) -> np.array:
+        # every occupied slot holds at least one point
+        return self.sums[slots] / self.counts[slots, None]
+
+    def voxel_keys(self, points: np.array) -> Tuple[np.array, np.array]:
+        # Returns the keys and a mask of the points within the range of the keys, the others are dropped
+        voxels = np.floor(points / self.voxel_size).astype(np.int64) + KEY_OFFSET
+        in_range = np.all((voxels >= 0) & (voxels < (1 << KEY_BITS)), axis=1)
+        np.clip(voxels, 0, (1 << KEY_BITS) - 1, out=voxels)
+        return (voxels[:, 0] << (2 * KEY_BITS)) | (voxels[:, 1] << KEY_BITS) | voxels[:, 2], in_range
+
+    def find(self, keys: np.array) -> np.array:
+        # Slot of every key or -1 if the voxel is not in the map
+        return np.fromiter(map(self.slot_of.get, keys.tolist(), repeat(-1)), dtype=np.int64, count=keys.shape[0])
+
+    def allocate(self, n: int, protected: np.array) -> np.array:
+        # Returns up to n free slots
+        if self.n_free < n:
+            # The map is full, evict the voxels which were observed the longest time ago
+            candidates = self.occupied[:self.n_occupied]
+            candidates = candidates[~np.isin(candidates, protected)]
+            n_evict = min(n - self.n_free, candidates.shape[0])
+            if n_evict > 0:
+                self.free(candidates[np.argpartition(self.last_seen[candidates], n_evict - 1)[:n_evict]])
+        n = min(n, self.n_free)
+        self.n_free -= n
+        return self.free_slots[self.n_free:self.n_free + n][::-1].copy()
+
+    def free(self, slots: np.array):
+        if slots.shape[0] == 0:
+            return
+        for key in self.keys[slots].tolist():
+            del self.slot_of[key]
+        self.keys[slots] = -1
+        self.counts[slots] = 0
+        self.sums[slots] = 0.0
+
+        occupied = self.occupied[:self.n_occupied]
+        remaining = occupied[self.keys[occupied] >= 0]
+        self.occupied[:remaining.shape[0]] = remaining
+        self.n_occupied = remaining.shape[0]
+
+        self.free_slots[self.n_free:self.n_free + slots.shape[0]] = slots
+        self.n_free += slots.shape[0]
@@ -0,0 +1,72 @@
+from math import atan2, ceil, cos, sin
+from typing import Dict
+
+import cv2
+import numpy as np
+
+from .config import *
+
+
+class OccupancyGrid:
+    """
+    Egocentric 2.5D grid around the user. Every cell stores an occupancy in [0, 1] and the highest obstacle point seen
+    in it. Row 0 is the far end of the grid, the user stands at the bottom center and looks up the grid.
+
+    On every update the grid is first moved with the ground plane motion of the camera and decayed, then the points of
+    the new frame pair are added. The cost only depends on the grid size and the number of new points.
+    """
+    def __init__(self, cell_size: float = OCCUPANCY_CELL, extent=OCCUPANCY_EXTENT):
+        self.cell_size = cell_size
+        self.extent = extent
+        self.shape = (int(ceil(extent[0] / cell_size)), int(ceil(2 * extent[1] / cell_size)))
+
+        self.occupancy = np.zeros(self.shape, dtype=np.float32)
+        self.height = np.zeros(self.shape, dtype=np.float32)  # m above the floor
+        self.scratch = np.zeros(self.shape, dtype=np.float32)
+
+        # Maps cell coordinates (column, row) to the ground plane (x, y) of the guidance frame and back
+        self.cell_to_ground = np.array([[0., -cell_size, extent[0]],
+                                        [-cell_size, 0., extent[1]],
+                                        [0., 0., 1.]])
+        self.ground_to_cell = np.linalg.inv(self.cell_to_ground)
+
+    def update(self, homography: np.array, points: np.array):
+        """
+        :param homography: [R|t] from the previous to the current camera, the points were triangulated in the former
+        :param points: (N, 3) points in the frame of the previous camera
+        """
+        # Motion of the ground plane in the guidance frame, only the rotation around the vertical axis is kept
+        rotation = CAMERA_TO_GUIDANCE.dot(homography[:, :3]).dot(CAMERA_TO_GUIDANCE.T)
+        translation = CAMERA_TO_GUIDANCE.dot(homography[:, 3])
+        yaw = atan2(rotation[1, 0], rotation[0, 0])
+        motion = np.array([[cos(yaw), -sin(yaw), translation[0]],
+                           [sin(yaw), cos(yaw), translation[1]],
+                           [0., 0., 1.]])
+        warp = self.ground_to_cell.dot(motion).dot(self.cell_to_ground)[:2]
+
+        for grid in (self.occupancy, self.height):
+            cv2.warpAffine(grid, warp, (self.shape[1], self.shape[0]), dst=self.scratch, flags=cv2.INTER_NEAREST,
+                           borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+            np.copyto(grid, self.scratch)
+        self.occupancy *= OCCUPANCY_DECAY
+
+        points = np.dot(points, homography[:, :3].T) + homography[:, 3]
+        points = np.dot(points, CAMERA_TO_GUIDANCE.T)
+        points = points[(points[:, 2] >= OCCUPANCY_HEIGHT_RANGE[0]) & (points[:, 2] < OCCUPANCY_HEIGHT_RANGE[1])]
+
+        cells = np.dot(points[:, :2], self.ground_to_cell[:2, :2].T) + self.ground_to_cell[:2, 2]
+        columns, rows = np.floor(cells[:, 0]).astype(np.int64), np.floor(cells[:, 1]).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.shape[0]) & (columns >= 0) & (columns < self.shape[1])
+        indices = rows[inside] * self.shape[1] + columns[inside]
+
+        hits = np.bincount(indices, minlength=self.occupancy.size).reshape(self.shape)
+        np.minimum(self.occupancy + OCCUPANCY_HIT * hits, 1.0, out=self.occupancy)
+        np.maximum.at(self.height.ravel(), indices, points[inside, 2] - OCCUPANCY_FLOOR)
+        self.height[self.occupancy < OCCUPANCY_THRESHOLD] = 0.0
+
+    def as_message(self) -> Dict:
+        # Compact representation for the other modules, both grids are quantized to uint8
+        return {"occupancy": np.round(self.occupancy * 255).astype(np.uint8),
+                "height": np.round(np.clip(self.height / OCCUPANCY_HEIGHT_RESOLUTION, 0, 255)).astype(np.uint8),
+                "cell_size": self.cell_size,
+                "extent": self.extent}
@@ -1,143 +1,136 @@
 import pathlib
 from typing import Optional
 
-import cv2
-import copy
-import matplotlib.pyplot as plt
 import numpy as np
 
 from ..module import Module
-from ...utils import normalize, MovingAverageFilter
+from ...messages import Criticality, HomographyData, OccupancyData, PointCloud
+from ...utils import normalize
+from .config import *
+from .collision import CollisionGrid, query_zones
+from .criticality_filter import CriticalityFilter
+from .decimation import decimate
+from .local_map import LocalMap
+from .occupancy import OccupancyGrid
+from .triangulation import Triangulator
 
 
 class ReprojectionModule(Module):
     def __init__(self, log_dir: pathlib.Path, args=None):
         super(ReprojectionModule, self).__init__(name="reprojection_module",
                                                  inputs=["position_module:homography"],
-                                                 outputs=[("points3d", 1000), ("criticality", 1000)],
-                                                 log_dir=log_dir)
-
-        self.average_filter = MovingAverageFilter()
+                                                 outputs=[("points3d", 1000), ("criticality", 1000),
+                                                          ("occupancy", 1)],
+                                                 log_dir=log_dir,
+                                                 schemas={"points3d": PointCloud, "criticality": Criticality,
+                                                          "occupancy": OccupancyData,
+                                                          "position_module:homography": HomographyData})
+
+        self.criticality_filter = CriticalityFilter()
+        self.expected_n_features: Optional[float] = None
+        self.expected_time_delta: Optional[float] = None
         self.use_alignment = False
 
         self.last_update_ts = None
         self.P0 = np.dot(self.intrinsic_matrix, np.eye(3, 4))
-
-        self.forward_direction = np.array((1., 0., 0.))
+        self.triangulator = Triangulator(self.intrinsic_matrix)
+        self.local_map = LocalMap() if USE_LOCAL_MAP else None
+        self.collision_grid = CollisionGrid()
+        self.occupancy_grid = OccupancyGrid()
 
     def start(self):
-        criticality_smooth = 0.0
         while True:
             homog_payload = self.get("position_module:homography")
             if homog_payload:
                 homography = homog_payload["data"]["homography"]
                 point_pairs = homog_payload["data"]["point_pairs"]
                 timestamps = homog_payload["data"]["timestamps"]
-                image = homog_payload["data"]["image"]
-
-                P1 = np.dot(self.intrinsic_matrix, homography)
-
-                points_homo = cv2.triangulatePoints(self.P0, P1, np.transpose(point_pairs[0]), np.transpose(point_pairs[1]))
-                points3d = cv2.convertPointsFromHomogeneous(points_homo.T)
-
-                # Ensure that signs of points are correct
-                for point in points3d:
-                    # Matrix to vector
-                    point_temp = copy.deepcopy(point[0])
-                    point = point[0]
-
-                    # Change coordinate system
-                    point[0] =  point_temp[2]
-                    point[1] = -point_temp[0]
-                    point[2] = -point_temp[1]
-
-                collision_probability = self.update_collision_probability(points3d, timestamps[1], image, homography)
-
-                self.publish("points3d", data={"cloud": points3d, "crit": collision_probability}, validity=-1, timestamp=self.get_time_ms())
-
-                uncertainty = self.average_filter("uncertainty", self.update_uncertainty(points3d.shape[0], timestamps[1]))
 
-                self.last_update_ts = timestamps[1]
-
-    def project3dto2d(self, homography: np.array, points3d: np.array):
-        rot_vec = cv2.Rodrigues(homography[:, :3])[0]
-        trans_vec = homography[:, 3:]
-        try:
-            points2d = cv2.projectPoints(points3d, rot_vec, trans_vec, self.intrinsic_matrix, distCoeffs=None)[0]
-        except Exception as e:
-            points2d = np.array([])
-        return points2d
-
-    @staticmethod
-    def visualize_reprojection(point_pairs: np.array, points2d: np.array, image: np.array):
-        pink = (255, 153, 255)
-        orange = (255, 128, 0)
-        keypoints = [cv2.KeyPoint(points2d[i, 0, 0], points2d[i, 0, 1], 5) for i in range(points2d.shape[0])]
-        image = cv2.drawKeypoints(image, keypoints, None, color=pink, flags=0)
-        for i in range(point_pairs.shape[0]):
-            image = cv2.line(image, tuple(point_pairs[1, :, i]), tuple(points2d[i, 0, :]), orange, 5)
+                # The feature tracking module may change its processing resolution at runtime
+                if not np.array_equal(homog_payload["data"]["intrinsic_matrix"], self.intrinsic_matrix):
+                    self.set_intrinsics(homog_payload["data"]["intrinsic_matrix"])
 
-        return image
+                P1 = np.dot(self.intrinsic_matrix, homography)
 
-    def update_collision_probability(self, points3d: np.array, timestamp: float, image: np.array, homography):
+                points_camera = self.triangulate(P1, point_pairs)
+                n_points = points_camera.shape[0]
 
-        point_vectors: np.array = points3d.reshape((points3d.shape[0], 3))
+                # Only the newly triangulated points are added, older observations decay in the grid
+                self.occupancy_grid.update(homography, points_camera)
+                self.publish("occupancy", OccupancyData(**self.occupancy_grid.as_message(), timestamp=timestamps[1]),
+                             -1)
 
-        distances = np.linalg.norm(point_vectors, axis=1, keepdims=False)
+                if self.local_map is not None:
+                    # The pose is chained even without valid points, otherwise the next pairs could not be aligned
+                    pose = self.local_map.update_pose(homography, timestamps)
+                    self.local_map.insert(points_camera, pose, timestamps[1])
+                    self.local_map.evict(timestamps[1])
+                    points_camera = self.local_map.query()
 
-        smooth_mean_distance = self.average_filter("mean_distance", distances.mean(), 20)
+                if points_camera.shape[0] == 0:
+                    self.logger.debug("No triangulated point passed the cheirality and reprojection checks.")
+                    continue
+                points3d = CAMERA_TO_GUIDANCE.dot(points_camera.T).T
 
-        # get the indices of the 10th percentile smallest distances
-        n = int(0.05 * distances.shape[0])
-        if n > 5:
-            idxs = np.argpartition(distances, n)[:n]
-            critical_points_3d = point_vectors[idxs, :]
+                self.collision_grid.build(points3d)
+                uncertainty = self.update_uncertainty(n_points, timestamps[1])
+                collision_probability = self.criticality_filter(self.collision_probability(), timestamps[1],
+                                                                uncertainty)
 
-            alignment_vectors = np.cross(critical_points_3d, self.forward_direction)
-            alignment = np.linalg.norm(alignment_vectors, axis=1, keepdims=False)
+                # The translation of the homography is scaled to meters by the position module
+                speed = float(np.linalg.norm(homography[:, 3])) / max((timestamps[1] - timestamps[0]) / 1000, 1e-3)
+                self.publish("criticality", Criticality(zones=query_zones(self.collision_grid, speed), speed=speed,
+                                                        timestamp=timestamps[1]), -1)
 
-            smooth_critical_alignment = self.average_filter("critical_alignments", np.arctan(alignment.mean()) * 2 / np.pi, 20)
+                self.publish("points3d", data=PointCloud(cloud=points3d, crit=collision_probability), validity=-1,
+                             timestamp=self.get_time_ms())
 
-            probability = (np.arctan(1 / distances) * 2 / np.pi).mean()
-        else:
-            probability = 0.0
-        smooth_probability = self.average_filter("probability", probability, 50)
+                self.last_update_ts = timestamps[1]
 
-        # plt.scatter(timestamp, smooth_mean_distance, c="b")
-        # plt.scatter(timestamp, smooth_critical_alignment , c="g")
-        #plt.scatter(timestamp, smooth_probability, c="r")
-        #plt.pause(0.001)
+    def reduce(self, channel: str, data, budget: int):
+        # Budgeted subscribers of points3d get a decimated cloud, e.g. for previews
+        if channel == "points3d":
+            return data.replace(cloud=decimate(data.cloud, budget))
+        return super().reduce(channel, data, budget)
+
+    def triangulate(self, P1: np.array, point_pairs: np.array) -> np.array:
+        # Returns the (N, 3) float32 points in the frame of the first camera, points which fail the checks are dropped.
+        # The point pairs are packed as (N, 4) rows of (x0, y0, x1, y1).
+        points_camera, valid = self.triangulator(P1, point_pairs[:, :2], point_pairs[:, 2:])
+        self.logger.debug(f"Rejected {valid.shape[0] - np.count_nonzero(valid)} of {valid.shape[0]} triangulated "
+                          "points by cheirality and reprojection error.")
+        return points_camera[valid]
+
+    def set_intrinsics(self, intrinsic_matrix: np.array):
+        self.intrinsic_matrix = intrinsic_matrix
+        self.P0 = np.dot(self.intrinsic_matrix, np.eye(3, 4))
+        self.triangulator.set_intrinsics(intrinsic_matrix)
 
-        return 2.0*smooth_probability
+    def collision_probability(self) -> float:
+        # Only the points in the corridor along the walking direction can lead to a collision
+        distances = np.linalg.norm(self.collision_grid.corridor(), axis=1)
 
-    def update_uncertainty(self, n_features: int, timestamp: float):
-        # compares the expected number of features and the actual number of features.
-        expected_n_features = self.average_filter("n_features", n_features, window_size=20)
-        if n_features > expected_n_features:
-            features_confidence = 1.0
-        else:
-            features_confidence = (expected_n_features - n_features) / expected_n_features
+        if distances.shape[0] > 5:
+            return 2.0 * float((np.arctan(1 / distances) * 2 / np.pi).mean())
+        return 0.0
 
-        assert 0 <= features_confidence <= 1.0, f"features_confidence should be in interval 0,1 but was {features_confidence}"
+    def update_uncertainty(self, n_features: int, timestamp: float) -> float:
+        # compares the number of features and the time since the last update with their expected values.
+        if self.expected_n_features is None:
+            self.expected_n_features = float(n_features)
+        self.expected_n_features += UNCERTAINTY_SMOOTHING * (n_features - self.expected_n_features)
+        features_confidence = min(n_features / self.expected_n_features, 1.0) if self.expected_n_features > 0 else 0.0
 
+        time_confidence = 1.0
         if self.last_update_ts is not None:
-
             time_delta = timestamp - self.last_update_ts
-            expected_time_delta = self.average_filter("time_delta", time_delta, window_size=20)
-
-            if time_delta > expected_time_delta:
-                time_confidence = 1.0
-            else:
-                time_confidence = (expected_time_delta - time_delta) / expected_time_delta
-        else:
-            time_confidence = 1.0
-
-        assert 0 <= time_confidence <= 1.0, "time_confidence should be in interval 0,1"
+            if self.expected_time_delta is None:
+                self.expected_time_delta = time_delta
+            self.expected_time_delta += UNCERTAINTY_SMOOTHING * (time_delta - self.expected_time_delta)
+            if time_delta > 0:
+                time_confidence = min(self.expected_time_delta / time_delta, 1.0)
 
         # take the average between the feature confidence and the time confidence
-        confidence: float = (features_confidence + time_confidence) / 2
-
-        uncertainty: float = 1. - confidence
+        confidence = (features_confidence + time_confidence) / 2
 
-        assert 0 <= uncertainty <= 1.0, "uncertainty should be in interval 0,1"
-        return uncertainty
+        return 1. - confidence
@@ -0,0 +1,92 @@
+from typing import Tuple
+
+import numpy as np
+
+from .config import *
+
+
+def project(points: np.array, P: np.array) -> Tuple[np.array, np.array]:
+    """
+    Projects (N, 3) points with the 3x4 projection matrix P = K [R|t] without distortion.
+    :return: (N, 2) pixel coordinates and (N,) depths in the camera. Points with depth 0 project to inf or nan.
+    """
+    projected = np.dot(points, P[:, :3].T) + P[:, 3]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return projected[:, :2] / projected[:, 2:], projected[:, 2]
+
+
+class Triangulator:
+    """
+    Triangulates all point pairs at once. The first camera is always K [I|0], so everything that only depends on it is
+    precomputed and only the second camera changes between calls.
+
+    MIDPOINT returns the midpoint of the shortest segment between the two viewing rays, which only needs dot products.
+    DLT solves the 4x4 system of every point with one batched SVD, the algorithm cv2.triangulatePoints uses point by
+    point.
+    """
+    def __init__(self, intrinsic_matrix: np.array, method: str = TRIANGULATION_METHOD):
+        assert method in ('MIDPOINT', 'DLT'), f"Unknown triangulation method {method}"
+        self.method = method
+        self.set_intrinsics(intrinsic_matrix)
+
+    def set_intrinsics(self, intrinsic_matrix: np.array):
+        self.intrinsic_matrix = intrinsic_matrix
+        self.inverse_intrinsics = np.linalg.inv(intrinsic_matrix)
+        self.P0 = np.dot(intrinsic_matrix, np.eye(3, 4))
+
+    def __call__(self, P1: np.array, points0: np.array, points1: np.array) -> Tuple[np.array, np.array]:
+        """
+        :param P1: 3x4 projection matrix K [R|t] of the second camera
+        :param points0: image points in the first camera, any shape with N * 2 elements
+        :param points1: corresponding image points in the second camera
+        :return: (N, 3) float32 points in the frame of the first camera and a boolean mask of the points which
+            pass the cheirality and reprojection error checks
+        """
+        points0 = points0.reshape(-1, 2).astype(np.float64)
+        points1 = points1.reshape(-1, 2).astype(np.float64)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if self.method == 'MIDPOINT':
+                points3d = self.midpoint(P1, points0, points1)
+            else:
+                points3d = self.dlt(P1, points0, points1)
+
+            # Cheirality: the point must have a positive depth in both cameras
+            valid = np.isfinite(points3d).all(axis=1)
+            for points, P in ((points0, self.P0), (points1, P1)):
+                pixels, depth = project(points3d, P)
+                error = pixels - points
+                valid &= (depth > 0) & (np.einsum("ij,ij->i", error, error) < MAX_REPROJECTION_ERROR ** 2)
+
+        return points3d.astype(np.float32), valid
+
+    def midpoint(self, P1: np.array, points0: np.array, points1: np.array) -> np.array:
+        Rt = np.dot(self.inverse_intrinsics, P1)
+        R, t = Rt[:, :3], Rt[:, 3]
+        center1 = -np.dot(R.T, t)
+
+        # Viewing rays with unit depth, the ray of the second camera is rotated into the frame of the first one
+        rays0 = np.dot(points0, self.inverse_intrinsics[:, :2].T) + self.inverse_intrinsics[:, 2]
+        rays1 = np.dot(np.dot(points1, self.inverse_intrinsics[:, :2].T) + self.inverse_intrinsics[:, 2], R)
+
+        # Depths s, u along the rays which minimize |s * ray0 - (center1 + u * ray1)|
+        a = np.einsum("ij,ij->i", rays0, rays0)
+        b = np.einsum("ij,ij->i", rays0, rays1)
+        c = np.einsum("ij,ij->i", rays1, rays1)
+        d = np.dot(rays0, center1)
+        e = np.dot(rays1, center1)
+        denominator = a * c - b * b
+        s = (c * d - b * e) / denominator
+        u = (b * d - a * e) / denominator
+
+        return 0.5 * (s[:, None] * rays0 + center1 + u[:, None] * rays1)
+
+    def dlt(self, P1: np.array, points0: np.array, points1: np.array) -> np.array:
+        A = np.empty((points0.shape[0], 4, 4))
+        for row, (points, P) in enumerate(((points0, self.P0), (points1, P1))):
+            A[:, 2 * row] = points[:, 0:1] * P[2] - P[0]
+            A[:, 2 * row + 1] = points[:, 1:2] * P[2] - P[1]
+
+        # The solution is the right singular vector of the smallest singular value
+        X = np.linalg.svd(A)[2][:, 3]
+        return X[:, :3] / X[:, 3:]
@@ -1 +1,2 @@
-from .visualization_module import VisualizationModule
\ No newline at end of file
+from .visualization_module import VisualizationModule
+from .headless_module import HeadlessVisualizationModule
@@ -0,0 +1,102 @@
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from .config import *
+from ...overlay import MatchOverlay
+
+BACKGROUND = (32, 32, 32)
+MATCH_COLOR = (255, 0, 0)  # BGR, blue like in the matplotlib view
+CRIT_COLOR = (0, 165, 255)
+USER_COLOR = (0, 160, 0)
+
+
+class FrameComposer:
+    """
+    Composes the camera view with the matches, the occupancy grid and the recent collision likelihood with OpenCV
+    into a BGR framebuffer. All views are drawn through dst= and views into the framebuffer, the only allocations per
+    frame are the small coordinate arrays of the matches.
+
+        +-----------------+-----------+
+        | camera, matches | occupancy |
+        +-----------------+-----------+
+        | collision likelihood        |
+        +-----------------------------+
+    """
+    def __init__(self, occupancy_width: int = HEADLESS_OCCUPANCY_WIDTH, crit_height: int = HEADLESS_CRIT_HEIGHT):
+        self.overlay = MatchOverlay()
+        width, height = self.overlay.size
+        self.shape = (height + crit_height, width + occupancy_width)
+        self.preview_roi = (slice(0, height), slice(0, width))
+        self.occupancy_roi = (slice(0, height), slice(width, width + occupancy_width))
+        self.crit_roi = (slice(height, height + crit_height), slice(0, self.shape[1]))
+
+        self.occupancy_scratch = np.empty((height, occupancy_width), dtype=np.uint8)
+        self.crit_values = np.full(MAX_DATA_LEN, np.nan, dtype=np.float32)
+        self.crit_x = np.linspace(0, self.shape[1] - 1, MAX_DATA_LEN).astype(np.float32)
+
+        self.image: Optional[np.array] = None
+        self.matches = None
+        self.occupancy: Optional[np.array] = None
+        self.dirty = False
+
+    def update_preview(self, image: np.array, matches=None):
+        # image in BGR as decoded by the drivers module, matches as (N, 4) rows of (x0, y0, x1, y1) in its pixels
+        self.image = image
+        self.matches = matches
+        self.dirty = True
+
+    def update_criticality(self, crit: float):
+        self.crit_values[:-1] = self.crit_values[1:]
+        self.crit_values[-1] = crit
+        self.dirty = True
+
+    def update_occupancy(self, grid):
+        self.occupancy = grid["occupancy"]
+        self.dirty = True
+
+    def compose(self, frame: np.array):
+        """
+        :param frame: (height, width, 3) BGR buffer of self.shape, usually a slot of the shared framebuffer
+        """
+        self.draw_preview(frame[self.preview_roi])
+        self.draw_occupancy(frame[self.occupancy_roi])
+        self.draw_criticality(frame[self.crit_roi])
+        self.dirty = False
+
+    def draw_preview(self, view: np.array):
+        if self.image is None:
+            view[:] = BACKGROUND
+            return
+
+        matches = self.matches if self.matches is not None else np.zeros((0, 4))
+        self.overlay.draw(self.image, matches[:, 2:], matches[:, :2], MATCH_COLOR, head_color=MATCH_COLOR, out=view)
+
+    def draw_occupancy(self, view: np.array):
+        if self.occupancy is None:
+            view[:] = BACKGROUND
+            return
+
+        # Row 0 is the far end of the grid, occupied cells are dark like in the matplotlib view
+        cv2.resize(self.occupancy, (view.shape[1], view.shape[0]), dst=self.occupancy_scratch,
+                   interpolation=cv2.INTER_NEAREST)
+        cv2.bitwise_not(self.occupancy_scratch, dst=self.occupancy_scratch)
+        cv2.cvtColor(self.occupancy_scratch, cv2.COLOR_GRAY2BGR, dst=view)
+
+        # The user stands at the bottom center of the grid
+        height, width = view.shape[:2]
+        cv2.fillConvexPoly(view, np.array([[width // 2, height - 10], [width // 2 - 5, height - 1],
+                                           [width // 2 + 5, height - 1]], dtype=np.int32), USER_COLOR)
+
+    def draw_criticality(self, view: np.array):
+        view[:] = BACKGROUND
+        valid = np.isfinite(self.crit_values)
+        if np.count_nonzero(valid) < 2:
+            return
+
+        height = view.shape[0]
+        y = (height - 1) * (1.0 - np.clip(self.crit_values[valid], 0.0, 1.0))
+        points = np.round(np.stack((self.crit_x[valid], y), axis=1)).astype(np.int32)
+        cv2.polylines(view, [points], False, CRIT_COLOR, 1)
+        cv2.putText(view, f"{self.crit_values[-1]:.2f}", (5, 15), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
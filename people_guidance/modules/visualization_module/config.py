@@ -0,0 +1,20 @@
+RENDER_HZ = 20  # maximum refresh rate of the figure, independent of how fast data arrives
+POINTS_3D_BUDGET = 1000  # maximum number of points of the cloud sent to the visualization
+
+FIGSIZE = (15, 12)
+DPI = 100
+
+MAX_DATA_LEN = 100  # number of criticality values shown
+CLOUD_LIMITS = ((5.0, -5.0), (-2.0, 2.0))  # m, fixed (lateral, height) limits of the front view, left is positive
+CLOUD_MAX_DISTANCE = 10.0  # m, upper end of the color scale of the front view
+
+SAVE_QUEUE_SIZE = 20  # rendered frames waiting for the encoder, frames are dropped if it can not keep up
+SAVE_FPS = RENDER_HZ  # frame rate written to the video, rendering is capped at RENDER_HZ
+SAVE_FOURCC = "MJPG"  # the MJPEG encoder is built into OpenCV and does not depend on the available ffmpeg codecs
+SAVE_FILENAME = "visualization.avi"  # used if --save_visualization is a folder
+
+# Headless mode, composes the views with OpenCV into a framebuffer in shared memory instead of a matplotlib figure
+HEADLESS_HZ = 10  # maximum number of composed frames per second, caps the CPU time spent on visualization
+HEADLESS_OCCUPANCY_WIDTH = 231  # px, the occupancy view has the height of the preview, see overlay.PREVIEW_SIZE
+HEADLESS_CRIT_HEIGHT = 60  # px, strip with the recent collision likelihood below both views
+HEADLESS_FRAMEBUFFER = "people_guidance_visualization"  # file name in /dev/shm, see framebuffer.py
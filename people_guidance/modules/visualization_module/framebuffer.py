@@ -0,0 +1,89 @@
+import pathlib
+import tempfile
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .config import *
+
+MAGIC = 0x50474642  # "PGFB"
+HEADER_DTYPE = np.dtype([("magic", "<u4"), ("height", "<u4"), ("width", "<u4"), ("channels", "<u4"),
+                         ("sequence", "<u8"), ("timestamp", "<f8")])
+HEADER_SIZE = 64  # the frames start at an aligned offset
+
+
+def framebuffer_path(name: str = HEADLESS_FRAMEBUFFER) -> pathlib.Path:
+    # /dev/shm is backed by memory on linux, other systems fall back to the temp folder
+    shm = pathlib.Path("/dev/shm")
+    return (shm if shm.is_dir() else pathlib.Path(tempfile.gettempdir())) / name
+
+
+class SharedFramebuffer:
+    """
+    Double buffered BGR image in a memory mapped file, written by one process and read by any number of viewers.
+
+    Frame number s is stored in slot s % 2 and the header holds the number of the last finished frame. The writer
+    composes frame s + 1 into the other slot and publishes it by incrementing the sequence. A reader copies the slot of
+    the published frame and retries if the sequence changed in the meantime, because the writer then may have started
+    to overwrite it.
+    """
+    def __init__(self, path: pathlib.Path, shape: Optional[Tuple[int, int]] = None):
+        """
+        :param path: location of the framebuffer, see framebuffer_path
+        :param shape: (height, width) to create a new framebuffer, None opens an existing one for reading
+        """
+        self.path = path
+        if shape is not None:
+            size = HEADER_SIZE + 2 * shape[0] * shape[1] * 3
+            self.mmap = np.memmap(path, dtype=np.uint8, mode="w+", shape=(size,))
+            self.header = self.mmap[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+            self.header["height"], self.header["width"], self.header["channels"] = shape[0], shape[1], 3
+            self.header["sequence"] = 0
+            self.header["magic"] = MAGIC
+        else:
+            self.mmap = np.memmap(path, dtype=np.uint8, mode="r")
+            self.header = self.mmap[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+            if self.header["magic"] != MAGIC:
+                raise ValueError(f"{path} is not a framebuffer.")
+
+        height, width = int(self.header["height"]), int(self.header["width"])
+        self.slots = self.mmap[HEADER_SIZE:].reshape((2, height, width, 3))
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.slots.shape[1:3]
+
+    @property
+    def back(self) -> np.array:
+        # slot of the next frame, it is not read by viewers until publish is called
+        return self.slots[(int(self.header["sequence"]) + 1) % 2]
+
+    def publish(self, timestamp: float):
+        self.header["timestamp"] = timestamp
+        self.header["sequence"] += 1
+
+    def read(self, out: Optional[np.array] = None, retries: int = 3) -> Optional[Tuple[int, float, np.array]]:
+        """
+        :return: (sequence, timestamp, frame) of the last published frame, None if nothing was published yet or if
+        the frame was overwritten while it was copied on every try
+        """
+        for _ in range(retries):
+            sequence, timestamp = int(self.header["sequence"]), float(self.header["timestamp"])
+            if sequence == 0:
+                return None
+            if out is None:
+                out = np.empty(self.slots.shape[1:], dtype=np.uint8)
+            np.copyto(out, self.slots[sequence % 2])
+            if int(self.header["sequence"]) == sequence:
+                return sequence, timestamp, out
+        return None
+
+    def close(self, unlink: bool = False):
+        """
+        :param unlink: removes the file, the writer does this so that no stale framebuffer keeps using memory. Viewers
+                       which still have it mapped keep their mapping.
+        """
+        self.mmap.flush()
+        del self.slots, self.header, self.mmap
+        if unlink:
+            self.path.unlink(missing_ok=True)
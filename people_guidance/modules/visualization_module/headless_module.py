@@ -0,0 +1,61 @@
+import pathlib
+from time import perf_counter, sleep
+from typing import Optional
+
+from ..module import Module
+from .composer import FrameComposer
+from .config import *
+from .framebuffer import SharedFramebuffer, framebuffer_path
+from .visualization_module import INPUT_SCHEMAS
+
+
+class HeadlessVisualizationModule(Module):
+    """
+    Visualization without matplotlib or a display, e.g. on the raspberry pi. The views are composed with OpenCV into a
+    shared memory framebuffer at no more than HEADLESS_HZ, examples/visualization/viewer.py shows it in a window.
+    """
+    def __init__(self, log_dir: pathlib.Path, args=None):
+        super(HeadlessVisualizationModule, self).__init__(name="headless_visualization_module", outputs=[],
+                                                          inputs=["feature_tracking_module:feature_point_pairs_vis",
+                                                                  # only the collision likelihood is shown
+                                                                  ("reprojection_module:points3d", 0),
+                                                                  "reprojection_module:occupancy"],
+                                                          log_dir=log_dir, schemas=INPUT_SCHEMAS)
+        self.args = args
+        self.framebuffer: Optional[SharedFramebuffer] = None
+
+    def start(self):
+        composer = FrameComposer()
+        path = framebuffer_path()
+        self.framebuffer = framebuffer = SharedFramebuffer(path, shape=composer.shape)
+        self.logger.info(f"Composing the visualization into {path}.")
+
+        next_frame = perf_counter()
+        while True:
+            # The inputs are drained on every iteration, only the latest data ends up in a frame
+            features = self.get("feature_tracking_module:feature_point_pairs_vis")
+            if features:
+                image = self.get_frame("feature_tracking_module", features["data"]["frame_id"])
+                if image is not None:
+                    composer.update_preview(image, features["data"]["point_pairs"] / features["data"]["scale"])
+
+            points_3d = self.get("reprojection_module:points3d")
+            if points_3d:
+                composer.update_criticality(points_3d["data"]["crit"])
+
+            occupancy = self.get("reprojection_module:occupancy")
+            if occupancy:
+                composer.update_occupancy(occupancy["data"])
+
+            now = perf_counter()
+            if composer.dirty and now >= next_frame:
+                composer.compose(framebuffer.back)
+                framebuffer.publish(self.get_time_ms())
+                next_frame = now + 1.0 / HEADLESS_HZ
+            elif not (features or points_3d or occupancy):
+                sleep(0.005)
+
+    def cleanup(self):
+        if self.framebuffer is not None:
+            self.framebuffer.close(unlink=True)
+            self.framebuffer = None
@@ -0,0 +1,127 @@
+import pathlib
+import threading
+from typing import Optional
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from .config import *
+from .video_sink import VideoSink
+from ...overlay import PREVIEW_SIZE
+
+
+class Renderer:
+    """
+    Owns the figure and all of its artists. The artists are created once with fixed axis limits and are only updated
+    with set_data / set_offsets. If the canvas supports it, only the artists are redrawn on top of a cached background
+    (blitting) instead of drawing the whole figure.
+
+    All methods must be called from the GUI thread. The data is handed over through update_* which only store
+    references, render is driven by a timer at RENDER_HZ.
+    """
+    def __init__(self, save_path: Optional[pathlib.Path] = None, logger=None):
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.dirty = False
+
+        self.fig = plt.figure(figsize=FIGSIZE, dpi=DPI)
+        ax_preview = self.fig.add_subplot(2, 2, 1)
+        ax_preview.set_title("Camera view")
+        ax_preview.set_axis_off()
+        self.preview = ax_preview.imshow(np.zeros((PREVIEW_SIZE[1], PREVIEW_SIZE[0], 3), dtype=np.uint8),
+                                         animated=True)
+
+        ax_cloud = self.fig.add_subplot(2, 2, 2)
+        ax_cloud.set_title("Front view point cloud")
+        ax_cloud.set_xlim(*CLOUD_LIMITS[0])
+        ax_cloud.set_ylim(*CLOUD_LIMITS[1])
+        self.cloud = ax_cloud.scatter(np.zeros(0), np.zeros(0), c=np.zeros(0), s=4, vmin=0.0,
+                                      vmax=CLOUD_MAX_DISTANCE, animated=True)
+        self.fig.colorbar(self.cloud, ax=ax_cloud)
+
+        ax_crit = self.fig.add_subplot(2, 2, 3)
+        ax_crit.set_title("Collision likelihood")
+        ax_crit.set_xlim(0, MAX_DATA_LEN - 1)
+        ax_crit.set_ylim(0.0, 1.0)
+        self.crit_values = np.full(MAX_DATA_LEN, np.nan)
+        self.crit = ax_crit.plot(np.arange(MAX_DATA_LEN), self.crit_values, ".-", animated=True)[0]
+
+        self.ax_occupancy = self.fig.add_subplot(2, 2, 4)
+        self.ax_occupancy.set_title("Top view occupancy")
+        self.occupancy = None  # created with the extent of the first grid
+
+        self.artists = [self.preview, self.cloud, self.crit]
+        self.background = None
+        self.fig.canvas.mpl_connect("draw_event", self.on_draw)
+
+        self.video_sink = None
+        if save_path is not None:
+            save_path.parent.mkdir(parents=True, exist_ok=True)
+            self.video_sink = VideoSink(save_path, logger=logger)
+
+        self.timer = self.fig.canvas.new_timer(interval=int(1000 / RENDER_HZ))
+        self.timer.add_callback(self.render)
+        self.timer.start()
+
+    def update_preview(self, image: np.array):
+        with self.lock:
+            self.preview.set_data(image)
+            self.dirty = True
+
+    def update_cloud(self, cloud: np.array):
+        # cloud in the guidance frame (x forward, y left, z up), the front view shows y and z colored by distance
+        with self.lock:
+            self.cloud.set_offsets(cloud[:, 1:3])
+            self.cloud.set_array(np.linalg.norm(cloud, axis=1))
+            self.dirty = True
+
+    def update_criticality(self, crit: float):
+        with self.lock:
+            self.crit_values[:-1] = self.crit_values[1:]
+            self.crit_values[-1] = crit
+            self.crit.set_ydata(self.crit_values)
+            self.dirty = True
+
+    def update_occupancy(self, grid):
+        with self.lock:
+            if self.occupancy is None:
+                # The user is at the bottom center of the grid and looks up
+                forward, half_width = grid["extent"]
+                self.occupancy = self.ax_occupancy.imshow(grid["occupancy"], cmap="gray_r", vmin=0, vmax=255,
+                                                          extent=(half_width, -half_width, 0.0, forward),
+                                                          animated=True)
+                self.artists.append(self.occupancy)
+            else:
+                self.occupancy.set_data(grid["occupancy"])
+            self.dirty = True
+
+    def on_draw(self, event):
+        # A full draw happened (first show, resize), the background without the animated artists is cached again
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox) if self.fig.canvas.supports_blit else None
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+
+    def render(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+
+            canvas = self.fig.canvas
+            if self.background is None:
+                canvas.draw()
+            else:
+                canvas.restore_region(self.background)
+                for artist in self.artists:
+                    self.fig.draw_artist(artist)
+                canvas.blit(self.fig.bbox)
+            canvas.flush_events()
+
+            if self.video_sink is not None:
+                # buffer_rgba is a view of the canvas memory, the sink converts it into one of its own buffers
+                self.video_sink.put(np.asarray(canvas.buffer_rgba()))
+
+    def close(self):
+        self.timer.stop()
+        if self.video_sink is not None:
+            self.video_sink.close()
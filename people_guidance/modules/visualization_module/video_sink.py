@@ -0,0 +1,108 @@
+import pathlib
+import queue
+import threading
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from .config import *
+
+
+class VideoSink:
+    """
+    Encodes the rendered frames into a single video file with cv2.VideoWriter on a background thread.
+
+    The frames are converted from the RGBA canvas buffer into a pool of preallocated BGR buffers, a buffer is handed to
+    the encoder through a bounded queue and returned to the pool once it is written. If the encoder can not keep up the
+    pool runs empty and new frames are dropped, the GUI thread never waits for the encoder.
+    """
+    def __init__(self, path: pathlib.Path, fps: float = SAVE_FPS, logger=None):
+        self.path = path
+        self.fps = fps
+        self.logger = logger
+
+        self.free: queue.Queue = queue.Queue()
+        self.filled: queue.Queue = queue.Queue(maxsize=SAVE_QUEUE_SIZE)
+        self.shape: Optional[tuple] = None
+        self.written_frames = 0
+        self.dropped_frames = 0
+        self.abort = threading.Event()
+
+        self.thread = threading.Thread(target=self.encoder_main, daemon=True)
+        self.thread.start()
+
+    def allocate(self, shape: tuple):
+        # The buffers of the old size are left to the garbage collector once the encoder returns them
+        self.shape = shape
+        self.free = queue.Queue()
+        for _ in range(SAVE_QUEUE_SIZE):
+            self.free.put(np.empty((shape[0], shape[1], 3), dtype=np.uint8))
+
+    def put(self, rgba: np.array):
+        """
+        :param rgba: (h, w, 4) view of the canvas buffer. It is only read during the call.
+        """
+        if rgba.shape[:2] != self.shape:
+            self.allocate(rgba.shape[:2])
+
+        try:
+            frame = self.free.get_nowait()
+        except queue.Empty:
+            self.drop()
+            return
+
+        # The only copy of the frame, it converts to the channel order of the encoder at the same time
+        cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR, dst=frame)
+        try:
+            self.filled.put_nowait((frame, self.free))
+        except queue.Full:
+            # only possible right after a resize while buffers of the old size are still queued
+            self.free.put(frame)
+            self.drop()
+
+    def drop(self):
+        self.dropped_frames += 1
+        if self.logger is not None and self.dropped_frames % 100 == 1:
+            self.logger.warning(f"Video encoding can not keep up, dropped {self.dropped_frames} frames.")
+
+    def close(self, timeout: float = 5.0):
+        # Waits for the queued frames so that the container is finalized properly
+        try:
+            self.filled.put(None, timeout=timeout)
+        except queue.Full:
+            # the encoder stops after the current frame and releases the writer, the queued frames are lost
+            if self.logger is not None:
+                self.logger.warning(f"Video encoding did not finish within {timeout} s, dropping the queued frames.")
+            self.abort.set()
+        self.thread.join(timeout=timeout)
+        if self.thread.is_alive():
+            if self.logger is not None:
+                self.logger.warning(f"Video encoder is still busy, {self.path} may be incomplete.")
+        elif self.logger is not None:
+            self.logger.info(f"Saved {self.written_frames} frames to {self.path}, dropped {self.dropped_frames}.")
+
+    def encoder_main(self):
+        writer = None
+        try:
+            while not self.abort.is_set():
+                item = self.filled.get()
+                if item is None:
+                    break
+
+                frame, pool = item
+                if writer is None or (frame.shape[1], frame.shape[0]) != frame_size:
+                    if writer is not None:
+                        writer.release()
+                    frame_size = (frame.shape[1], frame.shape[0])
+                    writer = cv2.VideoWriter(str(self.path), cv2.VideoWriter_fourcc(*SAVE_FOURCC), self.fps,
+                                             frame_size)
+                    if not writer.isOpened() and self.logger is not None:
+                        self.logger.error(f"Could not open {self.path} for video encoding with {SAVE_FOURCC}.")
+
+                writer.write(frame)
+                self.written_frames += 1
+                pool.put(frame)
+        finally:
+            if writer is not None:
+                writer.release()
@@ -0,0 +1,50 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+PREVIEW_SIZE = (410, 308)  # (width, height), half of the resized camera image
+MAX_MATCHES = 300  # segments drawn per preview, the matches are subsampled evenly above this
+
+
+class MatchOverlay:
+    """
+    Draws segments between two sets of points, e.g. matches or reprojections, on a downscaled copy of an image.
+
+    The image is resized into a buffer which is reused for every call, unless the caller passes its own. All segments
+    are drawn with a single cv2.polylines call and their number is capped at max_matches, so the cost only depends on
+    the preview size and not on the number of features.
+    The colors are in the channel order of the image.
+    """
+    def __init__(self, size: Tuple[int, int] = PREVIEW_SIZE, max_matches: int = MAX_MATCHES):
+        self.size = size
+        self.max_matches = max_matches
+        self.buffer = np.empty((size[1], size[0], 3), dtype=np.uint8)
+
+    def draw(self, image: np.array, start: np.array, end: np.array, color=(255, 0, 0), head_color=None,
+             thickness: int = 1, out: Optional[np.array] = None) -> np.array:
+        """
+        :param image: (h, w, 3) image the points refer to, it is not modified
+        :param start: (N, 2) pixel coordinates in image
+        :param end: (N, 2) pixel coordinates in image, marked with a dot in head_color if given
+        :param out: (size[1], size[0], 3) destination, defaults to the buffer of the overlay
+        :return: the preview, it is overwritten by the next call unless out is given
+        """
+        out = self.buffer if out is None else out
+        cv2.resize(image, self.size, dst=out, interpolation=cv2.INTER_AREA)
+
+        segments = self.segments(start, end, (self.size[0] / image.shape[1], self.size[1] / image.shape[0]))
+        if segments.shape[0] > 0:
+            cv2.polylines(out, segments, False, color, thickness)
+            if head_color is not None:
+                # A segment of length zero is drawn as a dot of the line thickness
+                cv2.polylines(out, segments[:, 1:].repeat(2, axis=1), False, head_color, thickness + 3)
+        return out
+
+    def segments(self, start: np.array, end: np.array, scale: Tuple[float, float]) -> np.array:
+        # (n, 2, 2) int32 polylines of at most max_matches evenly subsampled segments in preview coordinates
+        start, end = np.asarray(start).reshape(-1, 2), np.asarray(end).reshape(-1, 2)
+        step = max(1, -(-start.shape[0] // self.max_matches))
+        segments = np.stack((start[::step], end[::step]), axis=1).astype(np.float32)
+        segments *= np.array(scale, dtype=np.float32)
+        return np.round(segments, out=segments).astype(np.int32)
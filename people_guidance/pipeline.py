@@ -6,6 +6,7 @@ import datetime
 from typing import Callable, Optional, List, Dict, Tuple
 from psutil import cpu_percent, virtual_memory
 
+from .messages import check_schema
 from .utils import get_logger, ROOT_LOG_DIR, init_logging
 from .modules import Module
 
@@ -29,6 +30,13 @@ class Pipeline:
                 self.processes.append(p)
                 p.start()
 
+                if module.workers > 1:
+                    for worker_id in range(module.workers):
+                        p = mp.Process(target=self.start_module, kwargs={"module": module, "worker_id": worker_id},
+                                       daemon=True)
+                        self.processes.append(p)
+                        p.start()
+
             while True:
                 time.sleep(2)
                 if not all([proc.is_alive() for proc in self.processes]):
@@ -47,28 +55,55 @@ class Pipeline:
                     self.logger.debug("Could not load queue size because the platform does not support it.")
 
     @staticmethod
-    def start_module(module: Module):
+    def start_module(module: Module, worker_id: Optional[int] = None):
         init_logging()
+        module.worker_id = worker_id
         with module:
-            module.start()
+            if worker_id is None:
+                module.start()
+            else:
+                module.start_worker(worker_id)
 
-    def add_module(self, constructor: Callable, log_level=logging.DEBUG):
+    def add_module(self, constructor: Callable, log_level=logging.DEBUG, workers: int = 1):
+        # With workers > 1 the module runs in one process plus a pool of worker processes, see Module.start_worker
         module = constructor(log_dir=self.log_dir, args=self.args)
         module.log_level = log_level
         if module.name in self.modules:
             raise RuntimeError(f"Could not create a module with name {module.name} "
                                "because another module had the same name. Module names must be unique!")
+        if workers > 1 and type(module).start_worker is Module.start_worker:
+            raise RuntimeError(f"Could not create module {module.name} with {workers} workers "
+                               "because it does not implement start_worker.")
+        module.set_workers(workers)
         self.modules.update({module.name: module})
 
     def connect_subscriptions(self):
         for module in self.modules.values():
             try:
                 for channel_name in module.inputs:
-                    channel = self.get_channel(channel_name)
-                    module.subscribe(channel_name, channel)
+                    channel = self.get_channel(channel_name, module.input_budgets.get(channel_name),
+                                               tap=channel_name in module.taps)
+                    producer_name, output_name = channel_name.split(":")
+                    producer = self.modules[producer_name]
+                    self.check_schemas(channel_name, producer.schemas.get(output_name),
+                                       module.schemas.get(channel_name))
+                    module.subscribe(channel_name, channel, producer.arenas.get(output_name))
+
+                    if producer.frame_ring is not None:
+                        module.add_frame_source(producer.name, producer.frame_ring)
             except KeyError:
                 raise KeyError(f"Could not subscribe module {module.name}")
 
+    @staticmethod
+    def check_schemas(channel_name: str, produced: Optional[type], expected: Optional[type]):
+        # Untyped channels are not checked
+        if produced is None or expected is None:
+            return
+        try:
+            check_schema(produced, expected)
+        except TypeError as e:
+            raise TypeError(f"Schema mismatch on {channel_name}: {e}") from None
+
     def connect_services(self):
         for module in self.modules.values():
             try:
@@ -90,7 +125,7 @@ class Pipeline:
                            f"module {module_name}. Must be one of {services.keys()}")
         return services[service_name].requests, services[service_name].responses
 
-    def get_channel(self, channel_name):
+    def get_channel(self, channel_name, budget: Optional[int] = None, tap: bool = False):
         module_name, output_name = channel_name.split(":")
         if module_name not in self.modules:
             raise KeyError(
@@ -100,7 +135,11 @@ class Pipeline:
         if output_name not in outputs:
             raise KeyError(f"Cannot subscribe to {channel_name}: Unknown output {output_name}. "
                            f"Must be one of {outputs.keys()}")
-        return outputs[output_name]
+        if tap:
+            return self.modules[module_name].add_tap(output_name)
+        if budget is not None:
+            return self.modules[module_name].add_budgeted_output(output_name, budget)
+        return self.modules[module_name].add_subscriber(output_name)
 
     @staticmethod
     def create_log_dir() -> pathlib.Path:
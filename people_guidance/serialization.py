@@ -0,0 +1,105 @@
+import multiprocessing as mp
+import pickle
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .messages import Message
+
+OUT_OF_BAND_MIN_BYTES = 64 * 1024  # smaller buffers are pickled in-band, the copy is cheaper than the bookkeeping
+PROTOCOL = 5 if pickle.HIGHEST_PROTOCOL >= 5 else pickle.HIGHEST_PROTOCOL
+
+
+class Encoded:
+    """
+    A message whose large buffers are stored in the arena of its channel. Only the pickled header and the positions
+    of the buffers are sent through the queue.
+    """
+    __slots__ = ("header", "regions")
+
+    def __init__(self, header: bytes, regions: Tuple[Tuple[int, int], ...]):
+        self.header = header
+        self.regions = regions
+
+    def __reduce__(self):
+        return Encoded, (self.header, self.regions)
+
+
+class SharedArena:
+    """
+    Ring of bytes in shared memory, written by the producer of one channel and read by all of its subscribers.
+    It must be created before the processes are started.
+
+    Buffers are addressed by their position in the stream of all bytes ever written. The writer advances the
+    position before it copies a buffer, so a reader can tell from the position after its copy whether the buffer was
+    overwritten in the meantime. Readers which lag more than the capacity behind lose their messages.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.buffer = mp.RawArray('B', capacity)
+        self.position = mp.RawValue('q', 0)
+        self._bytes: Optional[np.array] = None
+
+    @property
+    def bytes(self) -> np.array:
+        # views are created lazily because they can not be sent to a new process
+        if self._bytes is None:
+            self._bytes = np.frombuffer(self.buffer, dtype=np.uint8)
+        return self._bytes
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_bytes"] = None
+        return state
+
+    def write(self, data: memoryview) -> Tuple[int, int]:
+        n_bytes = data.nbytes
+        start = self.position.value
+        offset = start % self.capacity
+        if offset + n_bytes > self.capacity:
+            # buffers are contiguous, the rest of the ring is skipped
+            start += self.capacity - offset
+            offset = 0
+        self.position.value = start + n_bytes
+        self.bytes[offset:offset + n_bytes] = np.frombuffer(data, dtype=np.uint8)
+        return start, n_bytes
+
+    def read(self, start: int, n_bytes: int) -> Optional[bytearray]:
+        offset = start % self.capacity
+        out = bytearray(n_bytes)
+        np.frombuffer(out, dtype=np.uint8)[:] = self.bytes[offset:offset + n_bytes]
+        if self.position.value - start > self.capacity:
+            return None
+        return out
+
+
+class MessageCodec:
+    """
+    Serializes messages with pickle protocol 5. Buffers of at least OUT_OF_BAND_MIN_BYTES, e.g. the data of large
+    arrays, are copied straight into the arena instead of the pickle stream. A subscriber copies them back into a
+    writable buffer which the unpickled arrays use without a further copy.
+    """
+    def __init__(self, arena: SharedArena):
+        self.arena = arena
+
+    def encode(self, message: Message) -> Encoded:
+        buffers: List[pickle.PickleBuffer] = []
+
+        def out_of_band(buffer: pickle.PickleBuffer) -> bool:
+            # returning False takes the buffer out of the pickle stream
+            raw = buffer.raw()
+            if raw.nbytes < OUT_OF_BAND_MIN_BYTES or raw.nbytes > self.arena.capacity // 4:
+                return True
+            buffers.append(buffer)
+            return False
+
+        header = pickle.dumps(message, protocol=PROTOCOL, buffer_callback=out_of_band)
+        regions = tuple(self.arena.write(buffer.raw()) for buffer in buffers)
+        return Encoded(header, regions)
+
+    def decode(self, encoded: Encoded) -> Optional[Message]:
+        # Returns None if a buffer of the message was already overwritten
+        buffers = [self.arena.read(start, n_bytes) for start, n_bytes in encoded.regions]
+        if any(buffer is None for buffer in buffers):
+            return None
+        return pickle.loads(encoded.header, buffers=buffers)
@@ -1,7 +1,8 @@
 import pathlib
 import logging
 import os
-from typing import Dict, List, Union
+import multiprocessing as mp
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 
@@ -26,6 +27,13 @@ else:
 DISTORTION_COEFFS = np.array([[ 0.19956839 , -0.49217089, -0.00235192, -0.00051292, 0.28251577]])
 
 
+def scale_intrinsics(intrinsic_matrix: np.array, scale: float) -> np.array:
+    # returns the intrinsic matrix for an image that was resized by scale
+    scaled = intrinsic_matrix.copy()
+    scaled[:2, :] *= scale
+    return scaled
+
+
 def project_path(relative_path: str) -> pathlib.Path:
     return ROOT_DIR / relative_path
 
@@ -70,3 +78,46 @@ class MovingAverageFilter:
                 self.keys[key].pop(0)
 
         return float(sum(self.keys[key]) / len(self.keys[key]))
+
+
+class SharedFrameRing:
+    """
+    Fixed size ring of images in shared memory. It must be created before the processes are started.
+    Frames are addressed by a monotonically increasing frame id and are overwritten once the ring wraps around.
+    """
+    def __init__(self, n_slots: int, shape: Tuple[int, ...], dtype=np.uint8):
+        self.n_slots = n_slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.buffer = mp.RawArray('b', n_slots * int(np.prod(shape)) * self.dtype.itemsize)
+        self.ids = mp.RawArray('q', [-1] * n_slots)
+        self._frames: Optional[np.array] = None
+
+    @property
+    def frames(self) -> np.array:
+        # views are created lazily because they can not be sent to a new process
+        if self._frames is None:
+            self._frames = np.frombuffer(self.buffer, dtype=self.dtype).reshape((self.n_slots,) + self.shape)
+        return self._frames
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_frames"] = None
+        return state
+
+    def write(self, frame_id: int, img: np.array):
+        slot = frame_id % self.n_slots
+        self.ids[slot] = -1
+        np.copyto(self.frames[slot], img)
+        self.ids[slot] = frame_id
+
+    def read(self, frame_id: int, copy: bool = True) -> Optional[np.array]:
+        # returns None if the frame was already overwritten
+        slot = frame_id % self.n_slots
+        if self.ids[slot] != frame_id:
+            return None
+        if not copy:
+            return self.frames[slot]
+        frame = self.frames[slot].copy()
+        # the frame could have been overwritten while it was copied
+        return frame if self.ids[slot] == frame_id else None